@@ -1,28 +1,51 @@
-from flask import Flask, abort, jsonify, request, url_for, redirect, render_template
+from flask import Flask, Response, abort, g, json, jsonify, make_response, request, url_for, redirect, render_template, stream_with_context
 from flask_cors import CORS
-from auth.auth import AuthError, requires_auth, gets_auth_if_existent, AUTH0_AUDIENCE, AUTH0_BASE_URL, AUTH0_CALLBACK_URL, AUTH0_CLIENT_ID, AUTH0_LOGOUT_CALLBACK_URL
-from config.setup import setup_db
+from auth.auth import AuthError, get_token_auth_header, jwks_store, requires_auth, gets_auth_if_existent, token_cache, AUTH0_AUDIENCE, AUTH0_BASE_URL, AUTH0_CALLBACK_URL, AUTH0_CLIENT_ID, AUTH0_LOGOUT_CALLBACK_URL
+from config.setup import db, pool_stats, setup_db, FAST_JSON, METRICS_TOKEN, QUERY_DETECTOR, QUERY_REPEAT_THRESHOLD, SERVER_TIMING, SLOW_QUERY_MS
 from config.populate_db import db_drop_and_create_all
-from config.models import Group, Role, Service, Vehicle, Volunteer
-from config.config import DATE_FORMAT, FULL_DATE_FORMAT
+from config.models import Group, Role, Service, Vehicle, Volunteer, GROUP_RELATIONS, ROLE_RELATIONS, SERVICE_FIELDS, SERVICE_RELATIONS, SERVICE_TIERS, VOLUNTEER_FIELDS, VOLUNTEER_RELATIONS, VOLUNTEER_TIERS, bulk_insert_volunteers, fetch_by_ids, search_volunteers, service_assignments, service_conflicts, services_at_risk, services_between, services_staffing, staffing_info, table_versions, vehicles_expiring
+from config.config import DATE_FORMAT, DEFAULT_PAGE_SIZE, DEFAULT_READINESS_DAYS, DEFAULT_SERVICE_DURATION, FULL_DATE_FORMAT, MAX_BULK_SIZE, MAX_PAGE_SIZE, MAX_READINESS_DAYS, PUBLIC_CACHE_MAX_AGE, PUBLIC_CACHE_SIZE, STREAM_CHUNK_SIZE
 from utils.auth import get_user_info
-from datetime import datetime
+from utils.cache import TTLCache
+from utils.conflicts import find_conflicts
+from utils.fast_json import init_json
+from utils.fields import field_options, parse_fields, serialize_fields
+from utils.metrics import init_metrics, render_gauges
+from utils.pagination import get_page_limit, iterate_pages, paginate, paginate_by_offset
+from utils.queries import init_query_detector, query_budget
+from datetime import date, datetime, time, timedelta
+from functools import partial, wraps
+import hashlib
+import hmac
 import os
 import constants
 
 def create_app(test_config=None):
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None and 'database_path' in test_config:
+        setup_db(app, test_config['database_path'])
+    else:
+        setup_db(app)
     CORS(app)
+    init_json(app, fast=FAST_JSON)
+    request_metrics = init_metrics(app, server_timing=SERVER_TIMING)
+    if QUERY_DETECTOR or test_config is not None and test_config.get('query_detector'):
+        init_query_detector(app, QUERY_REPEAT_THRESHOLD, SLOW_QUERY_MS)
+    metrics_token = test_config['metrics_token'] if test_config is not None and 'metrics_token' in test_config else METRICS_TOKEN
+
+    # Responses of the public (anonymous) tier of /services, cleared on every services write
+    public_services_cache = TTLCache(PUBLIC_CACHE_SIZE, ttl=PUBLIC_CACHE_MAX_AGE)
+    app.extensions['public_services_cache'] = public_services_cache
 
     # --- Uncomment to re/set the db. ALL DATA WILL BE LOST!
     # db_drop_and_create_all()
 
     # region CUSTOM ERRORS
     class RequestError(Exception):
-        def __init__(self, status, message):
+        def __init__(self, status, message, details=None):
             self.status = status
             self.message = message
+            self.details = details or {}
 
         def __str__(self):
             return {
@@ -31,6 +54,152 @@ def create_app(test_config=None):
             }
     # endregion
 
+    # region PAGINATION
+    def get_limit():
+        try:
+            return get_page_limit(request.args.get('limit'), DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        except ValueError:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_limit'])
+
+    def get_page(query, keys):
+        limit = get_limit()
+        try:
+            return paginate(query, keys, limit, request.args.get('cursor'))
+        except ValueError:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_cursor'])
+
+    def get_ranked_page(query):
+        limit = get_limit()
+        try:
+            return paginate_by_offset(query, limit, request.args.get('cursor'))
+        except ValueError:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_cursor'])
+
+    def resolve_ids(*requested_ids):
+        # Takes (model, ids) pairs and returns the rows of each list, reporting every missing id at once
+        resolved = []
+        invalid_ids = {}
+        for model, ids in requested_ids:
+            # Rows are linked once, however many times their ids are repeated
+            unique_ids = [id for index, id in enumerate(ids) if type(id) != int or id not in ids[:index]]
+            rows, missing = fetch_by_ids(model, unique_ids)
+            resolved.append(rows)
+            if missing:
+                invalid_ids[model.__tablename__] = missing
+        if invalid_ids:
+            raise RequestError(400, constants.ERROR_MESSAGES['invalid_list'], { 'invalid_ids': invalid_ids })
+        return resolved
+
+    def get_date_range():
+        # `from` and `to` are whole days, both included. `upcoming=1` starts the range today
+        try:
+            date_from = request.args.get('from')
+            date_from = datetime.strptime(date_from, DATE_FORMAT) if date_from else None
+            date_to = request.args.get('to')
+            date_to = datetime.strptime(date_to, DATE_FORMAT) + timedelta(days=1) if date_to else None
+        except ValueError:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_date_range'])
+
+        if request.args.get('upcoming') == '1':
+            today = datetime.combine(date.today(), time.min)
+            date_from = max(date_from, today) if date_from else today
+        return date_from, date_to
+
+    def get_fields(allowed):
+        # Fields selected with `fields`, among the ones of the permission tier, or None for all of them
+        fields, invalid = parse_fields(request.args.get('fields'), allowed)
+        if invalid:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_fields'], { 'invalid_fields': invalid, 'allowed_fields': list(allowed) })
+        return fields
+
+    def select_fields(query, fields, names, keys):
+        # Loads the columns and relationships of the fields `names` only, and serializes only them
+        return query.options(*field_options(fields, names, keys)), partial(serialize_fields, fields=fields, names=names)
+
+    def today_variant(daily=False):
+        # Responses relative to today must not be reused on the next day, even without any write
+        return date.today().isoformat() if daily or request.args.get('upcoming') == '1' else None
+
+    def wants_stream():
+        return request.args.get('stream') == '1' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+    def stream_records(query, keys, serialize):
+        # One JSON record per line, loading and releasing STREAM_CHUNK_SIZE rows at a time
+        def generate():
+            for rows in iterate_pages(query, keys, STREAM_CHUNK_SIZE):
+                for row in rows:
+                    yield json.dumps(serialize(row), separators=(',', ':')) + '\n'
+                db.session.expunge_all()
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # endregion
+
+    # region CONDITIONAL REQUESTS
+    def request_table_versions(tables):
+        # Read once per request, however many decorators need them
+        if 'table_versions' not in g:
+            g.table_versions = {}
+        if tables not in g.table_versions:
+            g.table_versions[tables] = table_versions(tables)
+        return g.table_versions[tables]
+
+    def conditional(*tables, daily=False):
+        # The ETag only changes when any of `tables` is written (or every day with `daily`), so it is known before serializing
+        def conditional_decorator(f):
+            @wraps(f)
+            def wrapper(jwt, *args, **kwargs):
+                versions = request_table_versions(tables)
+                if versions is None:
+                    return f(jwt, *args, **kwargs)
+
+                permissions = sorted(jwt.get('permissions', [])) if jwt else []
+                variant = json.dumps([request.full_path, wants_stream(), today_variant(daily), permissions, versions], sort_keys=True)
+                etag = hashlib.sha256(variant.encode()).hexdigest()
+
+                if request.if_none_match.contains(etag):
+                    response = app.response_class(status=304)
+                else:
+                    response = make_response(f(jwt, *args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                response.vary.update(['Authorization', 'Accept'])
+                return response
+            return wrapper
+        return conditional_decorator
+
+    def cached_for_public(cache, *tables):
+        # Each worker keeps its own responses, keyed on the versions of `tables` so the writes of other workers are seen
+        def cached_for_public_decorator(f):
+            @wraps(f)
+            def wrapper(jwt, *args, **kwargs):
+                if jwt is not None:
+                    return f(jwt, *args, **kwargs)
+
+                versions = request_table_versions(tables)
+                key = (request.full_path, wants_stream(), today_variant(), json.dumps(versions, sort_keys=True))
+                cached = cache.get(key)
+                if cached is None:
+                    response = make_response(f(jwt, *args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    cached = (response.get_data(), response.mimetype, response.get_etag()[0])
+                    cache.set(key, cached)
+
+                data, mimetype, etag = cached
+                if etag and request.if_none_match.contains(etag):
+                    response = app.response_class(status=304)
+                else:
+                    response = app.response_class(data, mimetype=mimetype)
+                if etag:
+                    response.set_etag(etag)
+                response.vary.update(['Authorization', 'Accept'])
+                response.cache_control.public = True
+                response.cache_control.max_age = PUBLIC_CACHE_MAX_AGE
+                return response
+            return wrapper
+        return cached_for_public_decorator
+    # endregion
+
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
@@ -45,6 +214,47 @@ def create_app(test_config=None):
         return render_template('main.html', access_token=jwt)
 
 
+    @app.route('/health')
+    def health():
+        return jsonify({
+            'success': True,
+            'pools': pool_stats()
+            })
+
+    @app.route('/metrics')
+    def metrics():
+        # Only served with METRICS_TOKEN set, to the scrapers sending it as their bearer token
+        if not metrics_token:
+            abort(404)
+        if not hmac.compare_digest(get_token_auth_header().encode(), metrics_token.encode()):
+            raise AuthError({
+                'code': 'invalid_metrics_token',
+                'description': constants.AUTH_ERROR_MESSAGES['invalid_metrics_token'],
+                'error': constants.HTTP_RESPONSES[401]
+            }, 401)
+
+        # Prometheus text format: the requests by endpoint, then the pools and caches behind them
+        pools = pool_stats()
+        jwks = jwks_store.stats()
+        caches = { 'tokens': token_cache.stats(), 'public_services': public_services_cache.stats() }
+        text = '\n'.join([
+            request_metrics.render(),
+            render_gauges('db_pool_size', 'Connections kept open by the pool.', [({ 'database': pool['database'] }, pool['size']) for pool in pools]),
+            render_gauges('db_pool_connections', 'Connections of the pool, by state.', [
+                ({ 'database': pool['database'], 'state': state }, pool[state]) for pool in pools for state in ('checked_in', 'checked_out', 'overflow')]),
+            render_gauges('db_pool_checkouts_total', 'Connections checked out from the pool.', [({ 'database': pool['database'] }, pool['checkouts']) for pool in pools], 'counter'),
+            render_gauges('db_pool_timeouts_total', 'Checkouts that timed out waiting for a connection.', [({ 'database': pool['database'] }, pool['timeouts']) for pool in pools], 'counter'),
+            render_gauges('auth_jwks_lookups_total', 'Signing keys looked up, by result.', [({ 'result': 'hit' }, jwks['hits']), ({ 'result': 'miss' }, jwks['misses'])], 'counter'),
+            render_gauges('auth_jwks_refreshes_total', 'Fetches of the JWKS, by result.', [({ 'result': 'ok' }, jwks['refreshes']), ({ 'result': 'error' }, jwks['refresh_errors'])], 'counter'),
+            render_gauges('auth_jwks_keys', 'Signing keys known.', [({}, jwks['keys'])]),
+            render_gauges('auth_jwks_age_seconds', 'Time since the JWKS was fetched.', [({}, jwks['age'])]),
+            render_gauges('cache_lookups_total', 'Lookups of the in-memory caches, by result.', [
+                ({ 'cache': name, 'result': result }, stats[counter]) for name, stats in caches.items() for result, counter in (('hit', 'hits'), ('miss', 'misses'))], 'counter'),
+            render_gauges('cache_evictions_total', 'Entries evicted from the in-memory caches over their size.', [({ 'cache': name }, stats['evictions']) for name, stats in caches.items()], 'counter'),
+            render_gauges('cache_entries', 'Entries of the in-memory caches.', [({ 'cache': name }, stats['size']) for name, stats in caches.items()])
+        ])
+        return Response(text + '\n', mimetype='text/plain; version=0.0.4')
+
     @app.route('/login')
     def login():
         return redirect(f'{AUTH0_BASE_URL}/authorize?audience={AUTH0_AUDIENCE}&response_type=token&scope=openid%20profile%20email%20picture%20nickname%20user_metadata&client_id={AUTH0_CLIENT_ID}&redirect_uri={AUTH0_CALLBACK_URL}')
@@ -60,13 +270,33 @@ def create_app(test_config=None):
     # region VOLUNTEERS
     @app.route('/volunteers/')
     @app.route('/volunteers')
+    @query_budget(3)
     @requires_auth('read:volunteers')
+    @conditional('volunteers', 'roles', 'groups')
     def get_volunteers(jwt):
-        db_data = Volunteer.query.all()
-        data = [vol.info() for vol in db_data]
+        permissions = jwt.get('permissions') if jwt else []
+        if 'read:volunteers-full' in permissions:
+            tier = 'fullData'
+        elif 'read:volunteers-details' in permissions:
+            tier = 'details'
+        else:
+            tier = 'info'
+
+        fields = get_fields(VOLUNTEER_TIERS[tier])
+        if fields is None:
+            query, serialize = Volunteer.query.options(*VOLUNTEER_RELATIONS), Volunteer.info
+        else:
+            query, serialize = select_fields(Volunteer.query, VOLUNTEER_FIELDS, fields, [Volunteer.id])
+
+        if wants_stream():
+            return stream_records(query, [Volunteer.id], serialize)
+
+        db_data, next_cursor = get_page(query, [Volunteer.id])
+        data = [serialize(vol) for vol in db_data]
         return jsonify({
             'success': True,
-            'volunteers': data
+            'volunteers': data,
+            'next_cursor': next_cursor
             })
 
     # @app.route('/volunteers/<int:id>', methods=['GET'])
@@ -96,11 +326,33 @@ def create_app(test_config=None):
     #         'volunteer': data
     #         })
 
+    @app.route('/volunteers/search')
+    @query_budget(4)
+    @requires_auth('read:volunteers-details')
+    @conditional('volunteers', 'roles', 'groups')
+    def search_volunteers_by_text(jwt):
+        text = request.args.get('q', '').strip()
+        if not text:
+            raise RequestError(400, constants.ERROR_MESSAGES['search_needed'])
+
+        permissions = jwt.get('permissions') if jwt else []
+        serialize = Volunteer.fullData if 'read:volunteers-full' in permissions else Volunteer.details
+
+        db_data, next_cursor = get_ranked_page(search_volunteers(text).options(*VOLUNTEER_RELATIONS))
+        data = [serialize(vol) for vol in db_data]
+        return jsonify({
+            'success': True,
+            'volunteers': data,
+            'next_cursor': next_cursor
+            })
+
     @app.route('/volunteers/<int:id>', methods=['GET'])
+    @query_budget(3)
     @requires_auth('read:volunteers-details')
+    @conditional('volunteers', 'roles', 'groups')
     def get_volunteer(jwt, id):
         permissions = jwt.get('permissions') if jwt else []
-        db_data = Volunteer.query.filter(Volunteer.id==id).one_or_none()
+        db_data = Volunteer.query.options(*VOLUNTEER_RELATIONS).filter(Volunteer.id==id).one_or_none()
         if db_data is None:
             raise RequestError(404, constants.ERROR_MESSAGES['vol_not_found'])
 
@@ -114,44 +366,69 @@ def create_app(test_config=None):
             'volunteer': data
             })
 
+    def read_volunteer_body(body):
+        if type(body) != dict:
+            raise RequestError(400, constants.ERROR_MESSAGES['body_needed'])
+        try:
+            name = body['name']
+            surnames = body['surnames']
+            birthday = body['birthday']
+            document = body['document']
+            address = body['address']
+            phone1 = body['phone1']
+        except:
+            raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
+
+        phone2 = body.get('phone2')
+        email = body.get('email')
+        role = body.get('role')
+        groups = body.get('groups')
+
+        if any([
+            type(name) != str,
+            type(surnames) != str,
+            type(document) != str,
+            type(address) != str,
+            type(phone1) != int,
+            (phone2 is not None and type(phone2) != int),
+            (email is not None and type(email) != str),
+        ]):
+            raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
+
+        try:
+            parsed_birthday = datetime.strptime(birthday, DATE_FORMAT).date()
+        except:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
+
+        if type(groups) == list and len(groups) > 5:
+            raise RequestError(400, constants.ERROR_MESSAGES['max_groups'])
+
+        return {
+            'name': name,
+            'surnames': surnames,
+            'birthday': birthday,
+            'parsed_birthday': parsed_birthday,
+            'document': document,
+            'address': address,
+            'email': email,
+            'phone1': phone1,
+            'phone2': phone2,
+            'role': role,
+            'groups': groups
+        }
+
     @app.route('/volunteers', methods=['POST'])
+    @query_budget(8)
     @requires_auth('create:volunteers')
     def create_volunteer(jwt):
         try:
             body = request.get_json()
             if body is None:
                 raise RequestError(400, constants.ERROR_MESSAGES['body_needed'])
-            try:
-                name = body['name']
-                surnames = body['surnames']
-                birthday = body['birthday']
-                document = body['document']
-                address = body['address']
-                phone1 = body['phone1']
-                dummy_data = body.get('dummy_data')
-            except:
-                raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
+            volunteer = read_volunteer_body(body)
+            dummy_data = body.get('dummy_data')
 
-            phone2 = body.get('phone2')
-            email = body.get('email')
-
-            if any([
-                type(name) != str,
-                type(surnames) != str,
-                type(document) != str,
-                type(address) != str,
-                type(phone1) != int,
-                (phone2 is not None and type(phone2) != int),
-                (email is not None and type(email) != str),
-            ]):
-                raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
-
-            try:
-                datetime.strptime(birthday, DATE_FORMAT)
-            except:
-                raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
-
-            role = body.get('role')
+            role = volunteer['role']
             if role is None:
                 role = 1
             else:
@@ -160,7 +437,7 @@ def create_app(test_config=None):
                 except:
                     raise RequestError(400, constants.ERROR_MESSAGES['invalid_role'])
 
-            groups = body.get('groups')
+            groups = volunteer['groups']
             if groups is None:
                 groups = [Group.query.filter(Group.id==7).one()]
             elif type(groups) == int:
@@ -169,25 +446,17 @@ def create_app(test_config=None):
                 except:
                     raise RequestError(400, constants.ERROR_MESSAGES['invalid_group'])
             else:
-                all_groups = []
-                if len(groups) > 5:
-                    raise RequestError(400, constants.ERROR_MESSAGES['max_groups'])
-                try:
-                    for group in groups:
-                        all_groups.append(Group.query.filter(Group.id==group).one())
-                    groups = all_groups
-                except:
-                    raise RequestError(400, constants.ERROR_MESSAGES['invalid_list'])
+                groups, = resolve_ids((Group, groups))
 
             new_volunteer = Volunteer(
-                name = name,
-                surnames = surnames,
-                birthday = birthday,
-                document = document,
-                address = address,
-                email = email,
-                phone1 = phone1,
-                phone2 = phone2,
+                name = volunteer['name'],
+                surnames = volunteer['surnames'],
+                birthday = volunteer['parsed_birthday'],
+                document = volunteer['document'],
+                address = volunteer['address'],
+                email = volunteer['email'],
+                phone1 = volunteer['phone1'],
+                phone2 = volunteer['phone2'],
                 active = True,
                 groups = groups,
                 role = role
@@ -202,11 +471,128 @@ def create_app(test_config=None):
                 }), 200 if dummy_data else 201
 
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
+        except:
+            abort(422)
+
+    @app.route('/volunteers/bulk', methods=['POST'])
+    @query_budget(8)
+    @requires_auth('create:volunteers')
+    def create_volunteers(jwt):
+        try:
+            body = request.get_json()
+            if type(body) != list or len(body) == 0:
+                raise RequestError(400, constants.ERROR_MESSAGES['body_list_needed'])
+            if len(body) > MAX_BULK_SIZE:
+                raise RequestError(400, constants.ERROR_MESSAGES['bulk_too_large'])
+
+            volunteers = []
+            errors = []
+            for index, item in enumerate(body):
+                try:
+                    volunteer = read_volunteer_body(item)
+                    # Roles and groups are looked up together, so their ids should be numbers
+                    if any([
+                        (volunteer['role'] is not None and type(volunteer['role']) != int),
+                        (volunteer['groups'] is not None and type(volunteer['groups']) != int and (
+                            type(volunteer['groups']) != list or any(type(group) != int for group in volunteer['groups'])
+                        )),
+                    ]):
+                        raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
+                    volunteers.append(volunteer)
+                except RequestError as error:
+                    volunteers.append(None)
+                    errors.append({ 'index': index, 'message': error.message })
+
+            # Roles and groups of the whole batch are checked with one query each
+            valid_volunteers = [vol for vol in volunteers if vol]
+            role_ids = { vol['role'] for vol in valid_volunteers if vol['role'] is not None }
+            group_ids = { 7 } | {
+                group for vol in valid_volunteers
+                for group in (vol['groups'] if type(vol['groups']) == list else [vol['groups']])
+                if group is not None
+            }
+            known_roles = { rol.id for rol in fetch_by_ids(Role, list(role_ids))[0] }
+            known_groups = { gr.id: gr for gr in fetch_by_ids(Group, list(group_ids))[0] }
+
+            for index, vol in enumerate(volunteers):
+                if vol is None:
+                    continue
+                if vol['role'] is None:
+                    vol['role'] = 1
+                elif vol['role'] not in known_roles:
+                    errors.append({ 'index': index, 'message': constants.ERROR_MESSAGES['invalid_role'] })
+                    continue
+
+                if vol['groups'] is None:
+                    vol['groups'] = [7]
+                elif type(vol['groups']) == int:
+                    if vol['groups'] not in known_groups:
+                        errors.append({ 'index': index, 'message': constants.ERROR_MESSAGES['invalid_group'] })
+                        continue
+                    vol['groups'] = [vol['groups']]
+                elif any(group not in known_groups for group in vol['groups']):
+                    errors.append({ 'index': index, 'message': constants.ERROR_MESSAGES['invalid_list'] })
+                else:
+                    # Each group is linked once
+                    vol['groups'] = list(dict.fromkeys(vol['groups']))
+
+            if errors:
+                raise RequestError(400, constants.ERROR_MESSAGES['bulk_invalid'], {
+                    'errors': sorted(errors, key=lambda error: error['index'])
+                })
+
+            # The whole batch is either created or only validated
+            dummy_flags = { bool(item.get('dummy_data')) for item in body }
+            if len(dummy_flags) > 1:
+                raise RequestError(400, constants.ERROR_MESSAGES['bulk_dummy_mixed'])
+            dummy_data = dummy_flags.pop()
+            if dummy_data:
+                new_volunteers = [Volunteer(
+                    name = vol['name'],
+                    surnames = vol['surnames'],
+                    birthday = vol['parsed_birthday'],
+                    document = vol['document'],
+                    address = vol['address'],
+                    email = vol['email'],
+                    phone1 = vol['phone1'],
+                    phone2 = vol['phone2'],
+                    active = True,
+                    groups = [known_groups[group] for group in vol['groups']],
+                    role = vol['role']
+                ) for vol in volunteers]
+            else:
+                new_ids = bulk_insert_volunteers([{
+                    'name': vol['name'],
+                    'surnames': vol['surnames'],
+                    'birthday': vol['parsed_birthday'],
+                    'document': vol['document'],
+                    'address': vol['address'],
+                    'email': vol['email'],
+                    'phone1': vol['phone1'],
+                    'phone2': vol['phone2'],
+                    'active': True,
+                    'role': vol['role'],
+                    'groups': vol['groups']
+                } for vol in volunteers])
+                new_volunteers = Volunteer.query.options(*VOLUNTEER_RELATIONS).filter(Volunteer.id.in_(new_ids)).order_by(Volunteer.id).all()
+
+            # Dummy volunteers are never flushed to the database
+            with db.session.no_autoflush:
+                data = [vol.fullData() for vol in new_volunteers]
+
+            return jsonify({
+                'created': False if dummy_data else True,
+                'volunteers': data
+                }), 200 if dummy_data else 201
+
+        except RequestError as error:
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
     @app.route('/volunteers/<id>', methods=['PATCH'])
+    @query_budget(11)
     @requires_auth('update:volunteers')
     def update_volunteer(jwt, id):
         if int(id) <= 3:
@@ -237,7 +623,8 @@ def create_app(test_config=None):
                 raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
 
             try:
-                stringified_date_on_body = datetime.strptime(birthday, DATE_FORMAT).strftime(DATE_FORMAT)
+                parsed_birthday = datetime.strptime(birthday, DATE_FORMAT).date()
+                stringified_date_on_body = parsed_birthday.strftime(DATE_FORMAT)
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
 
@@ -282,19 +669,13 @@ def create_app(test_config=None):
                 except:
                     raise RequestError(400, constants.ERROR_MESSAGES['invalid_group'])
             else:
-                all_groups = []
                 if len(groups) > 5:
                     raise RequestError(400, constants.ERROR_MESSAGES['max_groups'])
-                try:
-                    for group in groups:
-                        all_groups.append(Group.query.filter(Group.id==group).one())
-                    groups = all_groups
-                except:
-                    raise RequestError(400, constants.ERROR_MESSAGES['invalid_list'])
+                groups, = resolve_ids((Group, groups))
 
                 edited_volunteer.name = name
                 edited_volunteer.surnames = surnames
-                edited_volunteer.birthday = birthday
+                edited_volunteer.birthday = parsed_birthday
                 edited_volunteer.document = document
                 edited_volunteer.address = address
                 edited_volunteer.email = email
@@ -311,11 +692,12 @@ def create_app(test_config=None):
                 'volunteer': edited_volunteer.fullData()
                 })
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
     @app.route('/volunteers/<int:id>', methods=['DELETE'])
+    @query_budget(6)
     @requires_auth('delete:volunteers')
     def delete_volunteer(jwt, id):
         if id <= 4:
@@ -332,19 +714,22 @@ def create_app(test_config=None):
     # region ROLES
     @app.route('/roles/')
     @app.route('/roles')
+    @query_budget(3)
     @requires_auth('read:roles')
     def get_roles(jwt):
-        db_data = Role.query.all()
+        db_data, next_cursor = get_page(Role.query.options(*ROLE_RELATIONS), [Role.id])
         data = [rol.info() for rol in db_data]
         return jsonify({
             'success': True,
-            'roles': data
+            'roles': data,
+            'next_cursor': next_cursor
             })
 
     @app.route('/roles/<int:id>')
+    @query_budget(3)
     @requires_auth('read:roles')
     def get_role(jwt, id):
-        db_data = Role.query.filter(Role.id==id).one_or_none()
+        db_data = Role.query.options(*ROLE_RELATIONS).filter(Role.id==id).one_or_none()
         if db_data is None:
             raise RequestError(404, constants.ERROR_MESSAGES['rol_not_found'])
         data = db_data.info()
@@ -357,19 +742,22 @@ def create_app(test_config=None):
     # region GROUPS
     @app.route('/groups/')
     @app.route('/groups')
+    @query_budget(2)
     @requires_auth('read:groups')
     def get_groups(jwt):
-        db_data = Group.query.all()
+        db_data, next_cursor = get_page(Group.query.options(*GROUP_RELATIONS), [Group.id])
         data = [gr.info() for gr in db_data]
         return jsonify({
             'success': True,
-            'groups': data
+            'groups': data,
+            'next_cursor': next_cursor
             })
 
     @app.route('/groups/<int:id>')
+    @query_budget(2)
     @requires_auth('read:groups')
     def get_group(jwt, id):
-        db_data = Group.query.filter(Group.id==id).one_or_none()
+        db_data = Group.query.options(*GROUP_RELATIONS).filter(Group.id==id).one_or_none()
         if db_data is None:
             raise RequestError(404, constants.ERROR_MESSAGES['gr_not_found'])
         data = db_data.info()
@@ -382,17 +770,53 @@ def create_app(test_config=None):
     # region VEHICLES
     @app.route('/vehicles/')
     @app.route('/vehicles')
+    @query_budget(2)
     @requires_auth('read:vehicles')
+    @conditional('vehicles')
     def get_vehicles(jwt):
-        db_data = Vehicle.query.all()
+        if wants_stream():
+            return stream_records(Vehicle.query, [Vehicle.id], Vehicle.fullData)
+
+        db_data, next_cursor = get_page(Vehicle.query, [Vehicle.id])
         data = [veh.fullData() for veh in db_data]
         return jsonify({
             'success': True,
-            'vehicles': data
+            'vehicles': data,
+            'next_cursor': next_cursor
+            })
+
+    @app.route('/vehicles/readiness')
+    @query_budget(3)
+    @requires_auth('read:vehicles')
+    @conditional('vehicles', 'services', daily=True)
+    def get_vehicles_readiness(jwt):
+        try:
+            days = int(request.args.get('days', DEFAULT_READINESS_DAYS))
+        except ValueError:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_days'])
+        if days < 1 or days > MAX_READINESS_DAYS:
+            raise RequestError(400, constants.ERROR_MESSAGES['bad_days'])
+
+        today = date.today()
+        expiring = [{
+            **veh.fullData(),
+            'days_left': (veh.next_itv - today).days
+        } for veh in vehicles_expiring(today + timedelta(days=days))]
+
+        at_risk = {}
+        for ser, veh in services_at_risk(datetime.combine(today, time.min)):
+            at_risk.setdefault(ser.id, { **ser.info(), 'id': ser.id, 'vehicles': [] })['vehicles'].append(veh.fullData())
+
+        return jsonify({
+            'success': True,
+            'expiring_vehicles': expiring,
+            'services_at_risk': list(at_risk.values())
             })
 
     @app.route('/vehicles/<int:id>')
+    @query_budget(2)
     @requires_auth('read:vehicles')
+    @conditional('vehicles')
     def get_vehicle(jwt, id):
         db_data = Vehicle.query.filter(Vehicle.id==id).one_or_none()
         if db_data is None:
@@ -405,6 +829,7 @@ def create_app(test_config=None):
             })
 
     @app.route('/vehicles', methods=['POST'])
+    @query_budget(3)
     @requires_auth('create:vehicles')
     def create_vehicle(jwt):
         try:
@@ -429,7 +854,7 @@ def create_app(test_config=None):
                 raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
 
             try:
-                datetime.strptime(next_itv, DATE_FORMAT)
+                parsed_next_itv = datetime.strptime(next_itv, DATE_FORMAT).date()
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
 
@@ -440,7 +865,7 @@ def create_app(test_config=None):
                 brand = brand,
                 license = license_num,
                 year = year,
-                next_itv = next_itv,
+                next_itv = parsed_next_itv,
                 incidents = incidents,
                 active = True,
             )
@@ -453,11 +878,12 @@ def create_app(test_config=None):
                 }), 201
 
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
     @app.route('/vehicles/<id>', methods=['PATCH'])
+    @query_budget(4)
     @requires_auth('update:vehicles')
     def update_vehicle(jwt, id):
         if int(id) == 1:
@@ -485,7 +911,8 @@ def create_app(test_config=None):
                 raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
 
             try:
-                stringified_date_on_body = datetime.strptime(next_itv, DATE_FORMAT).strftime(DATE_FORMAT)
+                parsed_next_itv = datetime.strptime(next_itv, DATE_FORMAT).date()
+                stringified_date_on_body = parsed_next_itv.strftime(DATE_FORMAT)
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
 
@@ -513,16 +940,11 @@ def create_app(test_config=None):
 
             ]):
                 raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
-            try:
-                datetime.strptime(next_itv, DATE_FORMAT)
-            except:
-                raise RequestError(400, constants.ERROR_MESSAGES['bad_date'])
-
             edited_vehicle.name = name
             edited_vehicle.brand = brand
             edited_vehicle.license = license_num
             edited_vehicle.year = year
-            edited_vehicle.next_itv = next_itv
+            edited_vehicle.next_itv = parsed_next_itv
             edited_vehicle.incidents = incidents
             edited_vehicle.active = active
 
@@ -534,11 +956,12 @@ def create_app(test_config=None):
                 })
 
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
     @app.route('/vehicles/<int:id>', methods=['DELETE'])
+    @query_budget(4)
     @requires_auth('delete:vehicles')
     def delete_vehicle(jwt, id):
         if id <= 2:
@@ -555,25 +978,59 @@ def create_app(test_config=None):
     # region SERVICES
     @app.route('/services/')
     @app.route('/services')
+    @query_budget(5)
     @gets_auth_if_existent()
+    @cached_for_public(public_services_cache, 'services', 'volunteers', 'vehicles', 'roles')
+    @conditional('services', 'volunteers', 'vehicles', 'roles')
     def get_services(jwt):
         permissions = jwt.get('permissions') if jwt else []
-        db_data = Service.query.all()
-
+        query = services_between(Service.query, *get_date_range())
         if 'read:services-full' in permissions:
-            data = [ser.fullData() for ser in db_data]
+            serialize = Service.fullData
         elif 'read:services-details' in permissions:
-            data = [ser.details() for ser in db_data]
+            serialize = Service.details
         else:
-            data = [ser.info() for ser in db_data]
+            serialize = Service.info
+
+        fields = get_fields(SERVICE_TIERS[serialize.__name__])
+        if fields is not None:
+            query, serialize = select_fields(query, SERVICE_FIELDS, fields, [Service.date, Service.id])
+        elif serialize != Service.info:
+            query = query.options(*SERVICE_RELATIONS)
+
+        if wants_stream():
+            return stream_records(query, [Service.date, Service.id], serialize)
+
+        db_data, next_cursor = get_page(query, [Service.date, Service.id])
+        data = [serialize(ser) for ser in db_data]
 
         return jsonify({
             'success': True,
-            'services': data
+            'services': data,
+            'next_cursor': next_cursor
+            })
+
+    @app.route('/services/staffing')
+    @query_budget(2)
+    @requires_auth('read:services-details')
+    @conditional('services', 'volunteers', 'vehicles')
+    def get_services_staffing(jwt):
+        query = services_staffing(understaffed=request.args.get('understaffed') == '1')
+        query = services_between(query, *get_date_range())
+
+        db_data, next_cursor = get_page(query, [Service.date, Service.id])
+        data = [staffing_info(row) for row in db_data]
+        return jsonify({
+            'success': True,
+            'services': data,
+            'next_cursor': next_cursor
             })
 
     @app.route('/services/<int:id>', methods=['GET'])
+    @query_budget(5)
     @gets_auth_if_existent()
+    @cached_for_public(public_services_cache, 'services', 'volunteers', 'vehicles', 'roles')
+    @conditional('services', 'volunteers', 'vehicles', 'roles')
     def get_service(jwt, id):
         permissions = jwt.get('permissions') if jwt else []
         db_data = Service.query.filter(Service.id==id).one_or_none()
@@ -593,6 +1050,7 @@ def create_app(test_config=None):
             })
 
     @app.route('/services', methods=['POST'])
+    @query_budget(6)
     @requires_auth('create:services')
     def create_service(jwt):
         try:
@@ -605,11 +1063,15 @@ def create_app(test_config=None):
                 date = body['date']
                 vehicles_num = body['vehicles_num']
                 volunteers_num = body['volunteers_num']
+                duration = body.get('duration', DEFAULT_SERVICE_DURATION)
                 contact_name = body.get('contact_name')
                 contact_phone = body.get('contact_phone')
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
 
+            if type(duration) != int or duration <= 0:
+                raise RequestError(400, constants.ERROR_MESSAGES['bad_duration'])
+
             if any([
                 type(name) != str,
                 type(place) != str,
@@ -621,14 +1083,15 @@ def create_app(test_config=None):
                 raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
 
             try:
-                datetime.strptime(date, FULL_DATE_FORMAT)
+                parsed_date = datetime.strptime(date, FULL_DATE_FORMAT)
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['bad_full_date'])
 
             new_service = Service(
                 name = name,
                 place = place,
-                date = date,
+                date = parsed_date,
+                duration = duration,
                 vehicles_num = vehicles_num,
                 volunteers_num = volunteers_num,
                 contact_name = contact_name,
@@ -638,6 +1101,7 @@ def create_app(test_config=None):
             )
 
             new_service.insert()
+            public_services_cache.clear()
 
             return jsonify({
                 'created': True,
@@ -645,11 +1109,12 @@ def create_app(test_config=None):
                 }), 201
 
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
     @app.route('/services/<id>', methods=['PATCH'])
+    @query_budget(16)
     @requires_auth('update:services')
     def update_service(jwt, id):
         try:
@@ -672,6 +1137,7 @@ def create_app(test_config=None):
                 volunteers_num = body['volunteers_num']
                 vehicles = body['vehicles']
                 volunteers = body['volunteers']
+                duration = body.get('duration', edited_service.duration)
                 contact_name = body.get('contact_name')
                 contact_phone = body.get('contact_phone')
                 stringified_date_on_server = edited_service.date.strftime(FULL_DATE_FORMAT)
@@ -679,14 +1145,19 @@ def create_app(test_config=None):
                 raise RequestError(400, constants.ERROR_MESSAGES['missing_data'])
 
             try:
-                stringified_date_on_body = datetime.strptime(date, FULL_DATE_FORMAT).strftime(FULL_DATE_FORMAT)
+                parsed_date = datetime.strptime(date, FULL_DATE_FORMAT)
+                stringified_date_on_body = parsed_date.strftime(FULL_DATE_FORMAT)
             except:
                 raise RequestError(400, constants.ERROR_MESSAGES['bad_full_date'])
 
+            if type(duration) != int or duration <= 0:
+                raise RequestError(400, constants.ERROR_MESSAGES['bad_duration'])
+
             if all([
                 name == edited_service.name,
                 place == edited_service.place,
                 stringified_date_on_body == stringified_date_on_server,
+                duration == edited_service.duration,
                 vehicles_num == edited_service.vehicles_num,
                 volunteers_num == edited_service.volunteers_num,
                 contact_name == edited_service.contact_name,
@@ -709,25 +1180,21 @@ def create_app(test_config=None):
             ]):
                 raise RequestError(400, constants.ERROR_MESSAGES['wrong_type'])
 
-            all_volunteers = []
-            try:
-                for volunteer in volunteers:
-                    all_volunteers.append(Volunteer.query.filter(Volunteer.id==volunteer).one())
-                volunteers = all_volunteers
-            except:
-                raise RequestError(400, constants.ERROR_MESSAGES['invalid_list'])
+            volunteers, vehicles = resolve_ids((Volunteer, volunteers), (Vehicle, vehicles))
 
-            all_vehicles = []
-            try:
-                for vehicle in vehicles:
-                    all_vehicles.append(Vehicle.query.filter(Vehicle.id==vehicle).one())
-                vehicles = all_vehicles
-            except:
-                raise RequestError(400, constants.ERROR_MESSAGES['invalid_list'])
+            with db.session.no_autoflush:
+                conflicts = service_conflicts(edited_service.id, parsed_date, duration, [vol.id for vol in volunteers], [veh.id for veh in vehicles])
+            if conflicts['volunteers'] or conflicts['vehicles']:
+                conflicting_services = sorted({ id for resource in conflicts.values() for ids in resource.values() for id in ids })
+                raise RequestError(409, constants.ERROR_MESSAGES['service_conflict'], {
+                    'conflicting_services': conflicting_services,
+                    'conflicts': conflicts
+                })
 
             edited_service.name = name
             edited_service.place = place
-            edited_service.date = date
+            edited_service.date = parsed_date
+            edited_service.duration = duration
             edited_service.vehicles_num = vehicles_num
             edited_service.volunteers_num = volunteers_num
             edited_service.contact_name = contact_name
@@ -736,17 +1203,36 @@ def create_app(test_config=None):
             edited_service.volunteers = volunteers
 
             edited_service.update()
+            public_services_cache.clear()
 
             return jsonify({
                 'updated': True,
                 'service': edited_service.fullData()
                 })
         except RequestError as error:
-            raise RequestError(error.status, error.message)
+            raise RequestError(error.status, error.message, error.details)
         except:
             abort(422)
 
+    @app.route('/conflicts')
+    @query_budget(4)
+    @requires_auth('read:services-full')
+    @conditional('services', 'volunteers', 'vehicles')
+    def get_conflicts(jwt):
+        conflicts = find_conflicts(service_assignments(*get_date_range()))
+        data = [{
+            'resource': resource,
+            'id': resource_id,
+            'services': sorted(pair)
+        } for (resource, resource_id), overlaps in sorted(conflicts.items()) for pair in overlaps]
+
+        return jsonify({
+            'success': True,
+            'conflicts': data
+            })
+
     @app.route('/services/<int:id>', methods=['DELETE'])
+    @query_budget(5)
     @requires_auth('delete:services')
     def delete_service(jwt, id):
         if int(id) <= 3:
@@ -755,6 +1241,7 @@ def create_app(test_config=None):
         if db_data is None:
             raise RequestError(404, constants.ERROR_MESSAGES['ser_not_found'])
         db_data.delete()
+        public_services_cache.clear()
 
         return ('', 204)
 
@@ -768,7 +1255,8 @@ def create_app(test_config=None):
             'success': False,
             'error_code': error.status,
             'error': constants.HTTP_RESPONSES[error.status],
-            'message': error.message
+            'message': error.message,
+            **error.details
         }), error.status
 
     @app.errorhandler(AuthError)
@@ -830,7 +1318,12 @@ def create_app(test_config=None):
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `app` is only built when first used, so importing this module has no side effects
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    create_app().run()
\ No newline at end of file
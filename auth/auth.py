@@ -1,11 +1,14 @@
 from os import environ as env
 from flask import request, _request_ctx_stack
 from functools import wraps
-from jose import jwt
 from dotenv import load_dotenv, find_dotenv
 from urllib.request import urlopen
+from utils.cache import TTLCache
 import constants
+import hashlib
 import json
+import threading
+import time
 
 ENV_FILE = find_dotenv()
 if ENV_FILE:
@@ -20,6 +23,10 @@ AUTH0_CALLBACK_URL = env.get(constants.AUTH0_CALLBACK_URL)
 AUTH0_CLIENT_ID = env.get(constants.AUTH0_CLIENT_ID)
 AUTH0_CLIENT_SECRET = env.get(constants.AUTH0_CLIENT_SECRET)
 AUTH0_LOGOUT_CALLBACK_URL = env.get(constants.AUTH0_LOGOUT_CALLBACK_URL)
+JWKS_URL = f'{PROTOCOL}://{AUTH0_DOMAIN}/.well-known/jwks.json'
+JWKS_CACHE_TTL = int(env.get(constants.JWKS_CACHE_TTL, 600))
+JWKS_MIN_REFRESH_INTERVAL = int(env.get(constants.JWKS_MIN_REFRESH_INTERVAL, 30))
+TOKEN_CACHE_SIZE = int(env.get(constants.TOKEN_CACHE_SIZE, 1024))
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -33,6 +40,121 @@ class AuthError(Exception):
             'details': self.error
         }
 
+# region JWKS key store
+def fetch_jwks(url):
+    jsonurl = urlopen(url, timeout=5)
+    return json.loads(jsonurl.read())
+
+class JWKSKeyStore:
+    """Process-wide cache of the JWKS signing keys, indexed by `kid`.
+
+    Expired keys keep being served while a background thread fetches the new set.
+    An unknown `kid` forces a refresh (at most once per `min_refresh_interval`)
+    and concurrent refreshes share a single request to the endpoint.
+    """
+    def __init__(self, url, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL, fetcher=fetch_jwks):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.fetcher = fetcher
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_errors': 0
+        }
+
+    def get_key(self, kid):
+        rsa_key = self._keys.get(kid)
+        if rsa_key:
+            self._counters['hits'] += 1
+            if self._is_stale():
+                self.refresh_in_background()
+            return rsa_key
+
+        self._counters['misses'] += 1
+        if self._can_refresh():
+            self.refresh()
+        return self._keys.get(kid)
+
+    def refresh(self, blocking=True):
+        requested_at = time.monotonic()
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            # Another thread refreshed the keys while this one was waiting
+            if self._last_attempt is not None and self._last_attempt >= requested_at:
+                return self._fetched_at is not None
+
+            self._last_attempt = time.monotonic()
+            try:
+                jwks = self.fetcher(self.url)
+                keys = {
+                    key['kid']: {
+                        'kty': key['kty'],
+                        'kid': key['kid'],
+                        'use': key['use'],
+                        'n': key['n'],
+                        'e': key['e']
+                    } for key in jwks['keys']
+                }
+            except Exception:
+                self._counters['refresh_errors'] += 1
+                return False
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._counters['refreshes'] += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def refresh_in_background(self):
+        if self._lock.locked() or not self._can_refresh():
+            return
+        threading.Thread(target=self.refresh, kwargs={'blocking': False}, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
+
+    def stats(self):
+        return {
+            **self._counters,
+            'keys': len(self._keys),
+            'age': None if self._fetched_at is None else time.monotonic() - self._fetched_at
+        }
+
+    def _can_refresh(self):
+        return self._last_attempt is None or time.monotonic() - self._last_attempt >= self.min_refresh_interval
+
+    def _is_stale(self):
+        return time.monotonic() - self._fetched_at > self.ttl
+
+jwks_store = JWKSKeyStore(JWKS_URL)
+# endregion
+
+# region Verified tokens cache
+token_cache = TTLCache(TOKEN_CACHE_SIZE)
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_cached_payload(token):
+    return token_cache.get(token_digest(token))
+
+def cache_payload(token, payload):
+    # Entries leave the cache when the token itself expires
+    if 'exp' in payload:
+        token_cache.set(token_digest(token), payload, expires_at=payload['exp'])
+# endregion
+
 # region Get token
 def get_token_auth_header():
     auth = request.headers.get('Authorization', None)
@@ -69,8 +191,12 @@ def get_token_auth_header():
 
 # region Validate token
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'{PROTOCOL}://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    cached_payload = get_cached_payload(token)
+    if cached_payload is not None:
+        return cached_payload
+
+    # Imported on the first token to verify, it is the slowest import of the app
+    from jose import jwt
     try:
         unverified_header = jwt.get_unverified_header(token)
     except:
@@ -80,7 +206,6 @@ def verify_decode_jwt(token):
             'error': constants.HTTP_RESPONSES[401]
         }, 401)
 
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
@@ -88,15 +213,7 @@ def verify_decode_jwt(token):
             'error': constants.HTTP_RESPONSES[401]
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -106,6 +223,7 @@ def verify_decode_jwt(token):
                 audience=AUTH0_AUDIENCE,
                 issuer=f'{PROTOCOL}://{AUTH0_DOMAIN}/'
             )
+            cache_payload(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -201,27 +319,20 @@ def verify_decode_jwt_if_existent(token):
     if not token:
         return None
 
-    jsonurl = urlopen(f'{PROTOCOL}://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    cached_payload = get_cached_payload(token)
+    if cached_payload is not None:
+        return cached_payload
+
+    from jose import jwt
     try:
         unverified_header = jwt.get_unverified_header(token)
     except:
         return None
 
-    rsa_key = {}
     if 'kid' not in unverified_header:
         return None
 
-
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -231,6 +342,7 @@ def verify_decode_jwt_if_existent(token):
                 audience=AUTH0_AUDIENCE,
                 issuer=f'{PROTOCOL}://{AUTH0_DOMAIN}/'
             )
+            cache_payload(token, payload)
             return payload
 
         except:
@@ -0,0 +1,66 @@
+"""Time to encode the JSON of the responses, with the standard library and with orjson (see utils/fast_json.py).
+
+The `fullData()` of `--rows` volunteers, vehicles and services of a seeded database are serialized
+once, then their lists are encoded by `jsonify` `--repeat` times with each encoder. It reports,
+in milliseconds, the median time of a `jsonify` with each one, and checks that both wrote the
+same bytes.
+
+Usage: python benchmarks/encoding.py [--rows 10000] [--repeat 20]
+
+The database is a temporary SQLite database, seeded as by benchmarks/load.py.
+"""
+from flask import jsonify
+from flask.json import JSONEncoder
+from statistics import median
+import argparse
+import sys
+import tempfile
+import time
+
+from load import seed_database
+from app import create_app
+from config.models import SERVICE_RELATIONS, VOLUNTEER_RELATIONS, Service, Vehicle, Volunteer
+from utils.fast_json import FastJSONEncoder, orjson
+
+ENCODERS = {
+    'stdlib': JSONEncoder,
+    'orjson': FastJSONEncoder
+}
+
+def time_jsonify(app, encoder, key, data, repeat):
+    app.json_encoder = encoder
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = jsonify({ 'success': True, key: data })
+        timings.append((time.perf_counter() - started) * 1000)
+    return median(timings), response.get_data()
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the time to encode the JSON of the responses with the standard library and with orjson.')
+    parser.add_argument('--rows', type=int, default=10000, help='volunteers, vehicles and services encoded')
+    parser.add_argument('--repeat', type=int, default=20, help='times each list is encoded by each encoder')
+    args = parser.parse_args()
+    if orjson is None:
+        sys.exit('orjson is not installed, run pip install -r requirements.txt')
+
+    app = create_app({ 'database_path': f'sqlite:///{tempfile.mkdtemp()}/encoding.db' })
+    seed_database(app, volunteers=args.rows, vehicles=args.rows, services=args.rows)
+
+    print(f'fullData() of {args.rows} rows, encoded {args.repeat} times by jsonify')
+    print(f'{"resource":<12} {"stdlib":>9} {"orjson":>9} {"speedup":>8} {"bytes":>10}')
+    with app.test_request_context():
+        lists = {
+            'volunteers': [vol.fullData() for vol in Volunteer.query.options(*VOLUNTEER_RELATIONS).limit(args.rows)],
+            'vehicles': [veh.fullData() for veh in Vehicle.query.limit(args.rows)],
+            'services': [ser.fullData() for ser in Service.query.options(*SERVICE_RELATIONS).limit(args.rows)]
+        }
+        for key, data in lists.items():
+            stdlib, expected = time_jsonify(app, ENCODERS['stdlib'], key, data, args.repeat)
+            fast, encoded = time_jsonify(app, ENCODERS['orjson'], key, data, args.repeat)
+            if encoded != expected:
+                sys.exit(f'The {key} encoded by orjson are not the same as the ones encoded by the standard library')
+            print(f'{key:<12} {stdlib:9.2f} {fast:9.2f} {stdlib / fast:7.1f}x {len(encoded):10}')
+
+if __name__ == '__main__':
+    main()
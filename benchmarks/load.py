@@ -0,0 +1,281 @@
+"""Load test of the endpoints, replaying the requests of the Postman collection.
+
+Every request of prote-civ.postman_collection.json is sent `--rounds` times for each access
+level of `--levels`, by `--threads` concurrent clients, with tokens signed locally (see
+tests/fixtures.py). The requests on `{{created_..._id}}` use resources created before the
+run, and every DELETE of one of them deletes a resource created just for it. The dates of
+the services sent are moved to the future, as the services in the past cannot be changed.
+
+For each request and access level it reports, in milliseconds:
+- rps: requests per second, all the threads sending that same request
+- p50, p95, p99: latency percentiles
+- queries: SQL statements executed per request
+
+Usage: python benchmarks/load.py [--levels admin,manager,volunteer,public] [--threads 4] [--rounds 30] [--only text]
+                                 [--baseline benchmarks/baseline.json] [--save-baseline PATH]
+
+The database is a temporary SQLite database, seeded with the dummy resources and `--volunteers`,
+`--vehicles` and `--services` more. Another one can be given with --database, it is DROPPED
+and seeded the same way. With --baseline the results are compared to a previous run saved
+with --save-baseline: other statuses, more queries per request or fewer requests per second
+than the tolerance are regressions, and make the command fail. The requests per second are
+compared rather than the latencies, as the threads of a process take turns on the
+interpreter lock and the latency of each request depends on the turns it waited for. They
+are compared relative to the speed of the whole run, to tell the regressions of a handler
+apart from a slower or busier machine, which is reported instead.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from statistics import mean, median
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import create_app
+from config.config import FULL_DATE_FORMAT
+from config.populate_db import db_drop_and_create_all
+from config.setup import db
+from config.models import Group, Service, Vehicle, Volunteer, bulk_insert_volunteers
+from sqlalchemy import event
+from tests.fixtures import ACCESS_LEVELS, get_local_jwks
+
+COLLECTION = os.path.join(ROOT, 'prote-civ.postman_collection.json')
+CREATED_RESOURCES = {
+    '{{created_volunteer_id}}': ('volunteers', 'volunteer'),
+    '{{created_vehicle_id}}': ('vehicles', 'vehicle'),
+    '{{created_service_id}}': ('services', 'service')
+}
+
+# Past the services seeded, a year around now, so the services updated have no conflicts
+SERVICES_DATE = (datetime.now() + timedelta(days=730)).strftime(FULL_DATE_FORMAT)
+
+query_counter = threading.local()
+
+# region Collection
+def move_to_future(body):
+    """`body` with its valid service date, if any, replaced by SERVICES_DATE."""
+    try:
+        data = json.loads(body)
+        datetime.strptime(data['date'], FULL_DATE_FORMAT)
+    except (TypeError, ValueError, KeyError):
+        return body
+    return json.dumps({ **data, 'date': SERVICES_DATE })
+
+def load_requests(path=COLLECTION):
+    """The requests of the collection, as (name, method, path, body) tuples."""
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                yield from walk(item['item'])
+                continue
+            request = item['request']
+            url = request['url']['raw'] if isinstance(request['url'], dict) else request['url']
+            body = request.get('body', {}).get('raw') or None
+            path = url.replace('{{HOST}}', '') or '/'
+            yield item['name'], request['method'], path, move_to_future(body) if path.startswith('/services') else body
+
+    with open(path) as collection:
+        return list(walk(json.load(collection)['item']))
+
+def create_resource(client, create_requests, placeholder):
+    """Creates a resource with the first create request of its folder, returns its id."""
+    resource, key = CREATED_RESOURCES[placeholder]
+    body = create_requests[resource]
+    res = client.post(f'/{resource}', data=body, content_type='application/json', headers=authorization('admin'))
+    if res.status_code != 201:
+        raise RuntimeError(f'Could not create the {key} of the benchmark: {res.status_code} {res.data[:200]}')
+    return str(res.get_json()[key]['id'])
+# endregion
+
+# region Database
+def seed_database(app, volunteers, vehicles, services):
+    rng = random.Random(0)
+    with app.app_context():
+        db_drop_and_create_all()
+        group_ids = [group.id for group in Group.query]
+
+        bulk_insert_volunteers([{
+            'name': f'Vol {index}',
+            'surnames': f'Benchmark {index % 97}',
+            'birthday': date(1970, 1, 1) + timedelta(days=rng.randrange(15000)),
+            'document': f'{index:08d}-B',
+            'address': f'Calle {index % 50}, {index}',
+            'email': f'vol{index}@prote.ww',
+            'phone1': 600000000 + index,
+            'phone2': None,
+            'active': rng.random() > 0.1,
+            'role': rng.randint(1, 4),
+            'groups': rng.sample(group_ids, rng.randint(1, 3))
+        } for index in range(volunteers)])
+
+        new_vehicles = [Vehicle(
+            name=f'Vehicle {index}',
+            brand='Benchmark',
+            license=f'{index:04d}BCH',
+            year=2000 + index % 22,
+            next_itv=date.today() + timedelta(days=rng.randrange(-60, 365)),
+            incidents='',
+            active=True
+        ) for index in range(vehicles)]
+        db.session.add_all(new_vehicles)
+        db.session.commit()
+
+        volunteer_ids = [id for id, in db.session.query(Volunteer.id)]
+        now = datetime.now().replace(second=0, microsecond=0)
+        for index in range(services):
+            staff = rng.sample(volunteer_ids, min(len(volunteer_ids), rng.randint(1, 6)))
+            db.session.add(Service(
+                name=f'Service {index}',
+                place=f'Place {index % 30}',
+                date=now + timedelta(hours=rng.randrange(-24 * 365, 24 * 365)),
+                vehicles_num=2,
+                vehicles=rng.sample(new_vehicles, min(len(new_vehicles), 2)),
+                volunteers_num=6,
+                volunteers=Volunteer.query.filter(Volunteer.id.in_(staff)).all(),
+                contact_name='Benchmark',
+                contact_phone=12345678
+            ))
+        db.session.commit()
+
+def count_queries(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(connection, cursor, statement, parameters, context, executemany):
+        query_counter.count = getattr(query_counter, 'count', 0) + 1
+# endregion
+
+# region Run
+tokens = {}
+
+def authorization(level):
+    if level not in ACCESS_LEVELS:
+        return {}
+    if level not in tokens:
+        tokens[level] = get_local_jwks().token(ACCESS_LEVELS[level])
+    return { 'Authorization': f'Bearer {tokens[level]}' }
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_request(app, request, level, rounds, threads, created_ids, create_requests, warmup=0):
+    name, method, path, body = request
+    headers = authorization(level)
+
+    def send(_):
+        client = app.test_client()
+        url = path
+        for placeholder in CREATED_RESOURCES:
+            if placeholder in url:
+                # Every DELETE needs a resource of its own, not timed
+                url = url.replace(placeholder, create_resource(client, create_requests, placeholder) if method == 'DELETE' else created_ids[placeholder])
+
+        query_counter.count = 0
+        started = time.perf_counter()
+        res = client.open(url, method=method, data=body, content_type='application/json' if body else None, headers=headers)
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, res.status_code, query_counter.count
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, range(warmup)))
+        started = time.perf_counter()
+        samples = list(executor.map(send, range(rounds)))
+    wall = time.perf_counter() - started
+
+    latencies = [latency for latency, _, _ in samples]
+    return {
+        'requests': rounds,
+        'statuses': sorted({ status for _, status, _ in samples }),
+        'rps': round(rounds / wall, 1),
+        'p50': round(percentile(latencies, 0.50), 2),
+        'p95': round(percentile(latencies, 0.95), 2),
+        'p99': round(percentile(latencies, 0.99), 2),
+        'queries': round(mean(queries for _, _, queries in samples), 1)
+    }
+
+def compare(results, baseline, tolerance):
+    """Requests slower or running more queries than on the baseline, and the speed of the run.
+
+    The requests per second of each request are compared relative to the median ratio of all
+    of them, the speed of the run, which changes with the machine and its load.
+    """
+    common = [key for key in results if key in baseline]
+    speed = median(results[key]['rps'] / baseline[key]['rps'] for key in common) if common else 1
+
+    regressions = []
+    for key in common:
+        result, previous = results[key], baseline[key]
+        if result['statuses'] != previous['statuses']:
+            regressions.append(f'{key}: statuses {result["statuses"]}, {previous["statuses"]} on the baseline')
+        if result['queries'] > previous['queries']:
+            regressions.append(f'{key}: {result["queries"]:.1f} queries per request, {previous["queries"]:.1f} on the baseline')
+        if result['rps'] < previous['rps'] * speed * (1 - tolerance):
+            regressions.append(f'{key}: {result["rps"]:.1f} requests per second, {previous["rps"] * speed:.1f} expected from the baseline')
+    return regressions, speed
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays the requests of the Postman collection and measures them.')
+    parser.add_argument('--levels', default='admin', help='comma separated access levels: admin, manager, volunteer or public')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=30, help='times each request is sent, for each access level')
+    parser.add_argument('--warmup', type=int, default=4, help='times each request is sent before measuring it')
+    parser.add_argument('--only', default='', help='only the requests whose name contains this text')
+    parser.add_argument('--database', help='URL of the database to DROP and seed, a temporary SQLite database by default')
+    parser.add_argument('--volunteers', type=int, default=500)
+    parser.add_argument('--vehicles', type=int, default=20)
+    parser.add_argument('--services', type=int, default=200)
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.4, help='decrease of the requests per second allowed, 0.4 is 40%%')
+    parser.add_argument('--save-baseline', help='file where the results are saved')
+    args = parser.parse_args()
+
+    database = args.database or f'sqlite:///{tempfile.mkdtemp()}/load.db'
+    app = create_app({ 'database_path': database })
+    seed_database(app, args.volunteers, args.vehicles, args.services)
+    with app.app_context():
+        count_queries(db.engine)
+
+    requests = [request for request in load_requests() if args.only in request[0]]
+    create_requests = {}
+    for name, method, path, body in load_requests():
+        if method == 'POST' and body:
+            create_requests.setdefault(path.strip('/'), body)
+    client = app.test_client()
+    created_ids = { placeholder: create_resource(client, create_requests, placeholder) for placeholder in CREATED_RESOURCES }
+
+    levels = [level.strip() for level in args.levels.split(',') if level.strip()]
+    results = {}
+    for level in levels:
+        for request in requests:
+            results[f'{request[0]} @{level}'] = run_request(app, request, level, args.rounds, args.threads, created_ids, create_requests, args.warmup)
+
+    print(f'{len(requests)} requests x {len(levels)} access levels, {args.rounds} rounds, {args.threads} threads')
+    print(f'{"request":<70} {"status":>9} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8}')
+    for key, result in results.items():
+        statuses = ','.join(map(str, result['statuses']))
+        print(f'{key[:70]:<70} {statuses:>9} {result["rps"]:8.1f} {result["p50"]:8.2f} {result["p95"]:8.2f} {result["p99"]:8.2f} {result["queries"]:8.1f}')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline:
+            json.dump(results, baseline, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions, speed = compare(results, json.load(baseline), args.tolerance)
+        print(f'\nThe requests ran {speed:.2f} times as fast as on the baseline')
+        if regressions:
+            print(f'\n{len(regressions)} regressions against {args.baseline}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'\nNo regressions against {args.baseline}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Throughput of the production server, with the settings of gunicorn.conf.py and with the defaults of gunicorn.
+
+For each configuration of `--configs`, a gunicorn server is started on a seeded database and
+`--clients` concurrent clients send the GET requests of the Postman collection, with an admin
+token signed locally (see tests/fixtures.py), for `--duration` seconds. It reports:
+- first: milliseconds taken by the first request, before any other reached the server
+- rps: requests per second
+- p50, p95, p99: latency percentiles, in milliseconds
+- errors: requests not answered with their status of the Postman collection
+
+- production: gunicorn.conf.py, as run by the Procfile
+- default: no settings, one synchronous worker, as run by the Procfile before
+
+Usage: python benchmarks/server.py [--configs production,default] [--clients 16] [--duration 10] [--latency 0]
+
+The database is a temporary SQLite database, seeded as by benchmarks/load.py. Another one can be
+given with --database, it is DROPPED and seeded the same way. Run it on a machine like the
+production one: the number of workers depends on its cores. A local database answers at once,
+where a remote one takes a network round trip per statement: `--latency` adds that many
+milliseconds to every SQL statement, the time the threads of a worker can use for other requests.
+"""
+from gunicorn.app.base import Application
+from http.client import HTTPConnection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Thread
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from load import ROOT, authorization, load_requests, percentile, seed_database
+from app import create_app
+from config.setup import db
+
+CONFIGS = {
+    'production': os.path.join(ROOT, 'gunicorn.conf.py'),
+    'default': None
+}
+
+class BenchmarkServer(Application):
+    """Gunicorn serving the app on `database`, with the settings of `config_file` or the defaults."""
+    def __init__(self, config_file, database, port):
+        self.config_file = config_file
+        self.database = database
+        self.port = port
+        super().__init__()
+
+    def load_config(self):
+        if self.config_file:
+            self.load_config_from_file(self.config_file)
+        self.cfg.set('bind', f'127.0.0.1:{self.port}')
+        self.cfg.set('loglevel', 'warning')
+
+    def load(self):
+        return create_app({ 'database_path': self.database })
+
+def add_latency(milliseconds):
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def round_trip(connection, cursor, statement, parameters, context, executemany):
+        time.sleep(milliseconds / 1000)
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def wait_until_listening(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'The server did not listen on port {port} after {timeout} seconds')
+
+def send(connection, method, path, headers):
+    started = time.perf_counter()
+    connection.request(method, path, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return (time.perf_counter() - started) * 1000, response.status
+
+def run_clients(port, requests, clients, duration):
+    headers = authorization('admin')
+    deadline = time.perf_counter() + duration
+    samples = [[] for _ in range(clients)]
+
+    def client(index):
+        connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        position = index
+        while time.perf_counter() < deadline:
+            _, method, path, expected = requests[position % len(requests)]
+            latency, status = send(connection, method, path, headers)
+            samples[index].append((latency, status == expected))
+            position += 1
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return [sample for client_samples in samples for sample in client_samples], wall
+
+def expected_statuses(app, requests):
+    client = app.test_client()
+    return [(name, method, path, client.open(path, method=method, headers=authorization('admin')).status_code)
+        for name, method, path, _ in requests]
+
+def benchmark(config, database, requests, clients, duration):
+    port = free_port()
+    # Forked, so the server verifies the tokens with the local JWKS installed on this process
+    server = multiprocessing.get_context('fork').Process(target=lambda: BenchmarkServer(CONFIGS[config], database, port).run())
+    server.start()
+    try:
+        wait_until_listening(port)
+        connection = HTTPConnection('127.0.0.1', port, timeout=60)
+        first, _ = send(connection, 'GET', '/volunteers', authorization('admin'))
+        connection.close()
+        samples, wall = run_clients(port, requests, clients, duration)
+    finally:
+        server.terminate()
+        server.join()
+
+    latencies = [latency for latency, _ in samples]
+    return {
+        'first': round(first, 2),
+        'requests': len(samples),
+        'rps': round(len(samples) / wall, 1),
+        'p50': round(percentile(latencies, 0.50), 2),
+        'p95': round(percentile(latencies, 0.95), 2),
+        'p99': round(percentile(latencies, 0.99), 2),
+        'errors': sum(1 for _, expected in samples if not expected)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the throughput of gunicorn with the settings of the Procfile and with its defaults.')
+    parser.add_argument('--configs', default='production,default', help='comma separated configurations: production or default')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients, each one on a connection of its own')
+    parser.add_argument('--duration', type=float, default=10, help='seconds each configuration is measured')
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to every SQL statement, as a remote database would')
+    parser.add_argument('--database', help='URL of the database to DROP and seed, a temporary SQLite database by default')
+    parser.add_argument('--volunteers', type=int, default=500)
+    parser.add_argument('--vehicles', type=int, default=20)
+    parser.add_argument('--services', type=int, default=200)
+    args = parser.parse_args()
+
+    database = args.database or f'sqlite:///{tempfile.mkdtemp()}/server.db'
+    app = create_app({ 'database_path': database })
+    seed_database(app, args.volunteers, args.vehicles, args.services)
+    # Only the requests needing no resource created for them
+    requests = expected_statuses(app, [request for request in load_requests() if request[1] == 'GET' and '{{' not in request[2]])
+    with app.app_context():
+        db.engine.dispose()
+    if args.latency:
+        add_latency(args.latency)
+
+    print(f'{len(requests)} requests, {args.clients} clients, {args.duration:g} seconds, {args.latency:g} ms per SQL statement, {multiprocessing.cpu_count()} cores')
+    print(f'{"config":<12} {"first":>8} {"requests":>9} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"errors":>7}')
+    for config in [config.strip() for config in args.configs.split(',') if config.strip()]:
+        if config not in CONFIGS:
+            sys.exit(f'Unknown configuration {config}, choose among {", ".join(CONFIGS)}')
+        result = benchmark(config, database, requests, args.clients, args.duration)
+        print(f'{config:<12} {result["first"]:8.2f} {result["requests"]:9} {result["rps"]:8.1f} {result["p50"]:8.2f} {result["p95"]:8.2f} {result["p99"]:8.2f} {result["errors"]:7}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Startup time of the application.
+
+Every run starts a new Python process and measures, in milliseconds:
+- import: importing the app module
+- create_app: building the Flask app
+- first_request: the first GET of the endpoint, opening the first database connection
+- second_request: the same GET again
+
+Usage: python benchmarks/startup.py [--runs 10] [--path /services]
+
+The database of DATABASE_URL is used, or a temporary SQLite database with empty tables.
+"""
+from statistics import median
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+status = client.get(sys.argv[1]).status_code
+first = time.perf_counter()
+client.get(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({
+    'status': status,
+    'import': (imported - started) * 1000,
+    'create_app': (created - imported) * 1000,
+    'first_request': (first - created) * 1000,
+    'second_request': (second - first) * 1000
+}))
+'''
+
+CREATE_TABLES = '''
+import app
+from config.setup import db
+with app.create_app().app_context():
+    db.create_all()
+'''
+
+def run(code, env, *args):
+    result = subprocess.run([sys.executable, '-c', code, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the cold start of the application.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/services')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/startup.db'
+        run(CREATE_TABLES, env)
+
+    results = [json.loads(run(MEASURE, env, args.path)) for _ in range(args.runs)]
+    statuses = { result['status'] for result in results }
+    print(f'{args.runs} runs of GET {args.path} (status {", ".join(map(str, sorted(statuses)))})')
+    for step in ('import', 'create_app', 'first_request', 'second_request'):
+        values = [result[step] for result in results]
+        print(f'{step:>15}: median {median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms')
+
+if __name__ == '__main__':
+    main()
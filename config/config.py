@@ -1,2 +1,11 @@
 DATE_FORMAT = "%Y-%m-%d"
-FULL_DATE_FORMAT = "%Y-%m-%d, %H:%M"
\ No newline at end of file
+FULL_DATE_FORMAT = "%Y-%m-%d, %H:%M"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+MAX_BULK_SIZE = 1000
+PUBLIC_CACHE_SIZE = 256
+PUBLIC_CACHE_MAX_AGE = 60
+DEFAULT_SERVICE_DURATION = 120
+DEFAULT_READINESS_DAYS = 30
+MAX_READINESS_DAYS = 3650
\ No newline at end of file
@@ -1,21 +1,96 @@
-from .setup import db
+from .config import DEFAULT_SERVICE_DURATION
+from .setup import db, NAMES_CACHE_TTL, VEHICLE_READINESS_TABLE
+from sqlalchemy import case, cast, distinct, event, func, or_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from utils.conflicts import find_conflicts
+from utils.fields import Field
+from datetime import timedelta
+from itertools import chain
 import json
+import threading
+import time
 
+# Link tables are keyed by the direction they are loaded from most and indexed on the other one.
+# Keep them in sync with migrations/versions/3f6c2b8d9a41_add_link_tables_keys_and_indexes.py
 volunteer_groups = db.Table('volunteer_groups',
     db.Column('volunteer', db.Integer, db.ForeignKey('volunteers.id', ondelete="CASCADE")),
-    db.Column('group', db.Integer, db.ForeignKey('groups.id', ondelete="CASCADE"))
+    db.Column('group', db.Integer, db.ForeignKey('groups.id', ondelete="CASCADE")),
+    db.PrimaryKeyConstraint('volunteer', 'group', name='volunteer_groups_pkey'),
+    db.Index('ix_volunteer_groups_group', 'group')
     )
 
 services_volunteer = db.Table('services_volunteer',
     db.Column('volunteer', db.Integer, db.ForeignKey('volunteers.id', ondelete="CASCADE")),
-    db.Column('service', db.Integer, db.ForeignKey('services.id', ondelete="CASCADE"))
+    db.Column('service', db.Integer, db.ForeignKey('services.id', ondelete="CASCADE")),
+    db.PrimaryKeyConstraint('service', 'volunteer', name='services_volunteer_pkey'),
+    db.Index('ix_services_volunteer_volunteer', 'volunteer')
     )
 
 services_vehicles = db.Table('services_vehicles',
     db.Column('vehicle', db.Integer, db.ForeignKey('vehicles.id', ondelete="CASCADE")),
-    db.Column('service', db.Integer, db.ForeignKey('services.id', ondelete="CASCADE"))
+    db.Column('service', db.Integer, db.ForeignKey('services.id', ondelete="CASCADE")),
+    db.PrimaryKeyConstraint('service', 'vehicle', name='services_vehicles_pkey'),
+    db.Index('ix_services_vehicles_vehicle', 'vehicle')
     )
 
+NAMED_TABLES = ('roles', 'groups')
+
+class NamesCache:
+    """In-process id -> name maps of roles and groups shared by the serializers.
+
+    Role and Group writes invalidate it and bump `version`. The writes of other processes drop
+    the names as soon as their `table_versions` counters are read, and in `ttl` seconds otherwise.
+    """
+    def __init__(self, ttl=NAMES_CACHE_TTL):
+        self.version = 0
+        self.ttl = ttl
+        self._names = {}
+        self._table_versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, model):
+        cached = self._names.get(model.__tablename__)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+
+        version = self.version
+        loaded_at = time.monotonic()
+        names = { id: name for id, name in db.session.query(model.id, model.name) }
+        with self._lock:
+            # Skip storing names read before a concurrent invalidation
+            if version == self.version:
+                self._names[model.__tablename__] = (names, loaded_at)
+        return names
+
+    def sync(self, versions):
+        """Drops the names of the tables whose counter in `versions` moved since the last sync."""
+        with self._lock:
+            moved = [table for table in NAMED_TABLES if table in versions and self._table_versions.get(table) != versions[table]]
+            if moved:
+                self._names = { table: cached for table, cached in self._names.items() if table not in moved }
+                self._table_versions.update((table, versions[table]) for table in moved)
+                self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._names = {}
+            self.version += 1
+
+names_cache = NamesCache()
+
+def role_names():
+    return names_cache.get(Role)
+
+def group_names():
+    return names_cache.get(Group)
+
+# Loads the role and groups serialized by Volunteer.info/details/fullData
+# in a constant number of queries, however many volunteers are listed
+VOLUNTEER_RELATIONS = (joinedload('role_id'), selectinload('groups'))
+SERVICE_RELATIONS = (selectinload('volunteers'), selectinload('vehicles'))
+GROUP_RELATIONS = (selectinload('volunteers'),)
+ROLE_RELATIONS = (selectinload('volunteers').selectinload('groups'),)
+
 class Volunteer(db.Model):
     __tablename__ = 'volunteers'
 
@@ -28,7 +103,7 @@ class Volunteer(db.Model):
     email = db.Column(db.String(20))
     phone1 = db.Column(db.Integer, nullable=False)
     phone2 = db.Column(db.Integer)
-    active = db.Column(db.Boolean, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, index=True)
     role = db.Column(db.Integer, db.ForeignKey('roles.id'))
     groups = db.relationship('Group', secondary=volunteer_groups, backref=db.backref('volunteer'), cascade="all, delete", passive_deletes=True)
     services = db.relationship('Service', secondary=services_volunteer, backref=db.backref('volunteer'), cascade="all, delete", passive_deletes=True)
@@ -57,10 +132,15 @@ class Volunteer(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    def role_name(self):
+        if self.role_id is not None:
+            return self.role_id.name
+        # Volunteers not yet flushed only know their role by id
+        return role_names().get(self.role, 'Volunteer')
+
     def info(self):
         groups_list = [gr.name for gr in self.groups]
-        db_role = Role.query.filter(Role.id==self.role).one_or_none()
-        role_name = db_role.name if db_role else 'Volunteer'
+        role_name = self.role_name()
         return {
             'name': self.name,
             'surnames': self.surnames,
@@ -71,8 +151,7 @@ class Volunteer(db.Model):
 
     def details(self):
         groups_list = [gr.name for gr in self.groups]
-        db_role = Role.query.filter(Role.id==self.role).one_or_none()
-        role_name = db_role.name if db_role else 'Volunteer'
+        role_name = self.role_name()
         return {
             'id': self.id,
             'name': self.name,
@@ -87,8 +166,7 @@ class Volunteer(db.Model):
 
     def fullData(self):
         groups_list = [gr.name for gr in self.groups]
-        db_role = Role.query.filter(Role.id==self.role).one_or_none()
-        role_name = db_role.name if db_role else 'Volunteer'
+        role_name = self.role_name()
         return {
             'id': self.id,
             'name': self.name,
@@ -104,6 +182,184 @@ class Volunteer(db.Model):
             'active': self.active
         }
 
+def fetch_by_ids(model, ids):
+    """Fetches the `model` rows of `ids` with a single IN query.
+
+    Returns the rows found, in the same order as `ids`, and the ids that were not found.
+    """
+    valid_ids = { id for id in ids if type(id) == int }
+    found = { row.id: row for row in model.query.filter(model.id.in_(valid_ids)) } if valid_ids else {}
+    return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
+
+# Engines on which the pg_trgm extension is installed, checked once per engine
+trigram_support = {}
+
+def has_trigrams():
+    engine = db.engine
+    if engine not in trigram_support:
+        trigram_support[engine] = engine.dialect.name == 'postgresql' and \
+            engine.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").scalar() is not None
+    return trigram_support[engine]
+
+def search_volunteers(text):
+    """Query of the volunteers matching `text`, best matches first.
+
+    Matches the start of the name, surnames, full name, document and phones, ignoring case, with
+    the prefix indexes of the volunteers table. With pg_trgm, full names similar to `text` also match.
+    """
+    term = text.strip().lower()
+    prefix = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    full_name = func.lower(Volunteer.name + ' ' + Volunteer.surnames)
+    fields = [func.lower(Volunteer.name), func.lower(Volunteer.surnames), full_name, func.lower(Volunteer.document)]
+    if term.isdigit():
+        fields += [cast(Volunteer.phone1, db.Text), cast(Volunteer.phone2, db.Text)]
+
+    exact = or_(*[field == term for field in fields])
+    prefixed = or_(*[field.like(prefix, escape='\\') for field in fields])
+    matches = [prefixed]
+    rank = case([(exact, 2), (prefixed, 1)], else_=0)
+
+    if has_trigrams():
+        # `%` is pg_trgm's similarity operator, doubled for the psycopg2 paramstyle
+        matches.append(full_name.op('%%')(term))
+        rank = rank + func.similarity(full_name, term)
+
+    return Volunteer.query.filter(or_(*matches)).order_by(rank.desc(), Volunteer.id)
+
+def services_between(query, date_from=None, date_to=None):
+    """Restricts a Service query to the half-open range [date_from, date_to), served by ix_services_date."""
+    if date_from is not None:
+        query = query.filter(Service.date >= date_from)
+    if date_to is not None:
+        query = query.filter(Service.date < date_to)
+    return query
+
+def services_staffing(understaffed=False):
+    """Query of the required and assigned volunteers and vehicles of each service.
+
+    The links are counted in a single GROUP BY per service, so no relationship is loaded.
+    With `understaffed`, only the services missing volunteers or vehicles are kept.
+    """
+    # Both link tables are joined at once, so each link is repeated once per link of the other table
+    volunteers_assigned = func.count(distinct(services_volunteer.c.volunteer))
+    vehicles_assigned = func.count(distinct(services_vehicles.c.vehicle))
+    query = db.session.query(
+        Service.id,
+        Service.name,
+        Service.date,
+        Service.volunteers_num,
+        volunteers_assigned.label('volunteers_assigned'),
+        Service.vehicles_num,
+        vehicles_assigned.label('vehicles_assigned')
+    ).outerjoin(services_volunteer, services_volunteer.c.service == Service.id
+    ).outerjoin(services_vehicles, services_vehicles.c.service == Service.id
+    ).group_by(Service.id)
+
+    if understaffed:
+        query = query.having(or_(volunteers_assigned < Service.volunteers_num, vehicles_assigned < Service.vehicles_num))
+    return query
+
+def staffing_info(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'date': row.date,
+        'volunteers_num': row.volunteers_num,
+        'volunteers_assigned': row.volunteers_assigned,
+        'volunteers_vacancies': max(row.volunteers_num - row.volunteers_assigned, 0),
+        'vehicles_num': row.vehicles_num,
+        'vehicles_assigned': row.vehicles_assigned,
+        'vehicles_vacancies': max(row.vehicles_num - row.vehicles_assigned, 0)
+    }
+
+def service_assignments(date_from=None, date_to=None, volunteers=None, vehicles=None):
+    """(resource, service id, start, end) of every volunteer and vehicle assigned to the services in the range.
+
+    Resources are ('volunteers', id) and ('vehicles', id) tuples. The services started before
+    `date_from` that may still be ongoing are also included. `volunteers` and `vehicles`
+    restrict the resources to those ids.
+    """
+    if date_from is not None:
+        longest = db.session.query(func.max(Service.duration)).scalar() or 0
+        date_from = date_from - timedelta(minutes=longest)
+
+    assignments = []
+    for resource, table, column, ids in (
+        ('volunteers', services_volunteer, services_volunteer.c.volunteer, volunteers),
+        ('vehicles', services_vehicles, services_vehicles.c.vehicle, vehicles)
+    ):
+        if ids is not None and not ids:
+            continue
+        query = db.session.query(column, Service.id, Service.date, Service.duration).join(table, table.c.service == Service.id)
+        query = services_between(query, date_from, date_to)
+        if ids is not None:
+            query = query.filter(column.in_(ids))
+        for resource_id, service_id, date, duration in query:
+            assignments.append(((resource, resource_id), service_id, date, date + timedelta(minutes=duration)))
+    return assignments
+
+def service_conflicts(service_id, start, duration, volunteers, vehicles):
+    """Services that would overlap with service `service_id` if it had these times, volunteers and vehicles.
+
+    Returns a dict of the conflicting service ids of each volunteer and vehicle id, under 'volunteers' and 'vehicles'.
+    """
+    end = start + timedelta(minutes=duration)
+    assignments = [assignment for assignment in service_assignments(start, end, volunteers, vehicles) if assignment[1] != service_id]
+    assignments += [(('volunteers', id), service_id, start, end) for id in volunteers]
+    assignments += [(('vehicles', id), service_id, start, end) for id in vehicles]
+
+    conflicts = { 'volunteers': {}, 'vehicles': {} }
+    for (resource, resource_id), overlaps in find_conflicts(assignments).items():
+        services = sorted({ id for pair in overlaps if service_id in pair for id in pair if id != service_id })
+        if services:
+            conflicts[resource][resource_id] = services
+    return conflicts
+
+# Rows inserted per INSERT statement. The MAX_BULK_SIZE volunteers of a bulk request (10 parameters
+# each), and their links (up to 5 each, of 2 parameters), fit in one, below the bind parameters limits
+BULK_INSERT_BATCH_SIZE = 5000
+
+def bulk_insert_volunteers(rows):
+    """Inserts the volunteers and their volunteer_groups links in a single transaction.
+
+    Each row is a dict of Volunteer columns plus the list of its `groups` ids.
+    Returns the ids of the new volunteers, in the same order as the rows.
+    """
+    volunteers_table = Volunteer.__table__
+    new_ids = []
+    try:
+        for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+            batch = [{ key: value for key, value in row.items() if key != 'groups' } for row in rows[start:start + BULK_INSERT_BATCH_SIZE]]
+            if db.engine.dialect.implicit_returning:
+                # A multi-row VALUES may return its rows in any order, so the ids are matched to the
+                # rows by the values inserted. Rows with the same values are interchangeable
+                columns = sorted(batch[0])
+                result = db.session.execute(volunteers_table.insert().values(batch).returning(
+                    volunteers_table.c.id, *[volunteers_table.c[column] for column in columns]))
+                ids_by_values = {}
+                for row_id, *values in result:
+                    ids_by_values.setdefault(tuple(values), []).append(row_id)
+                new_ids.extend(ids_by_values[tuple(values[column] for column in columns)].pop(0) for values in batch)
+            elif db.engine.dialect.name == 'sqlite':
+                # The rows of an executemany take the next rowids in order, and no other
+                # connection can insert until this transaction ends
+                db.session.execute(volunteers_table.insert(), batch)
+                last_ids = db.session.execute(select([volunteers_table.c.id]).order_by(volunteers_table.c.id.desc()).limit(len(batch)))
+                new_ids.extend(reversed([row_id for row_id, in last_ids]))
+            else:
+                for values in batch:
+                    new_ids.append(db.session.execute(volunteers_table.insert().values(values)).inserted_primary_key[0])
+
+        links = [{ 'volunteer': volunteer_id, 'group': group_id } for volunteer_id, row in zip(new_ids, rows) for group_id in row['groups']]
+        for start in range(0, len(links), BULK_INSERT_BATCH_SIZE):
+            db.session.execute(volunteer_groups.insert().values(links[start:start + BULK_INSERT_BATCH_SIZE]))
+        bump_table_versions(db.session, ['volunteers'])
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    return new_ids
+
 class Vehicle(db.Model):
     __tablename__ = 'vehicles'
 
@@ -112,7 +368,7 @@ class Vehicle(db.Model):
     brand = db.Column(db.String(20), nullable=False)
     license = db.Column(db.String(7), nullable=False)
     year = db.Column(db.Integer, nullable=False)
-    next_itv = db.Column(db.Date, nullable=False)
+    next_itv = db.Column(db.Date, nullable=False, index=True)
     incidents = db.Column(db.String(200))
     active = db.Column(db.Boolean, nullable=False)
     services = db.relationship('Service', secondary=services_vehicles, backref=db.backref('vehicle'), cascade="all, delete", passive_deletes=True)
@@ -163,7 +419,9 @@ class Service(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(40), nullable=False)
     place = db.Column(db.String(40), nullable=False)
-    date = db.Column(db.DateTime, nullable=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
+    # In minutes
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SERVICE_DURATION, server_default=str(DEFAULT_SERVICE_DURATION))
     vehicles_num = db.Column(db.Integer, nullable=False)
     vehicles = db.relationship("Vehicles", db.ForeignKey('vehicles.id'))
     volunteers_num = db.Column(db.Integer, nullable=False)
@@ -172,10 +430,11 @@ class Service(db.Model):
     volunteers = db.relationship('Volunteer', secondary=services_volunteer, backref=db.backref('service_id'), cascade="all, delete", passive_deletes=True)
     vehicles = db.relationship('Vehicle', secondary=services_vehicles, backref=db.backref('service_id'), cascade="all, delete", passive_deletes=True)
 
-    def __init__(self, name, place, date, vehicles_num, vehicles, volunteers_num, volunteers, contact_name, contact_phone):
+    def __init__(self, name, place, date, vehicles_num, vehicles, volunteers_num, volunteers, contact_name, contact_phone, duration=DEFAULT_SERVICE_DURATION):
         self.name = name
         self.place = place
         self.date = date
+        self.duration = duration
         self.vehicles_num = vehicles_num
         self.volunteers = volunteers
         self.vehicles = vehicles
@@ -202,18 +461,23 @@ class Service(db.Model):
             'date': self.date,
         }
 
+    def volunteers_info(self):
+        roles_list = role_names()
+        return [{ 'name': f'{vol.name} {vol.surnames}', 'role': roles_list.get(vol.role, 'Volunteer') } for vol in self.volunteers]
+
+    def vehicles_info(self):
+        return [f'{veh.name} {veh.year}' for veh in self.vehicles]
+
     def details(self):
-        roles_list = {
-          rol.id: rol.name for rol in Role.query.all()
-        }
-        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'role': roles_list[vol.role] } for vol in self.volunteers]
-        vehicles_list = [f'{veh.name} {veh.year}' for veh in self.vehicles]
+        volunteers_list = self.volunteers_info()
+        vehicles_list = self.vehicles_info()
 
         return {
             'id': self.id,
             'name': self.name,
             'place': self.place,
             'date': self.date,
+            'duration': self.duration,
             'vehicles_num': self.vehicles_num,
             'vehicles': vehicles_list,
             'volunteers_num': self.volunteers_num,
@@ -221,17 +485,15 @@ class Service(db.Model):
         }
 
     def fullData(self):
-        roles_list = {
-          rol.id: rol.name for rol in Role.query.all()
-        }
-        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'role': roles_list[vol.role] } for vol in self.volunteers]
-        vehicles_list = [f'{veh.name} {veh.year}' for veh in self.vehicles]
+        volunteers_list = self.volunteers_info()
+        vehicles_list = self.vehicles_info()
 
         return {
             'id': self.id,
             'name': self.name,
             'place': self.place,
             'date': self.date,
+            'duration': self.duration,
             'vehicles_num': self.vehicles_num,
             'vehicles': vehicles_list,
             'volunteers_num': self.volunteers_num,
@@ -240,6 +502,46 @@ class Service(db.Model):
             'contact_phone': self.contact_phone,
         }
 
+# Fields that can be selected with the `fields` parameter, and the ones written by each serializer,
+# the fields each permission tier can select. The relationships are only loaded for their fields
+VOLUNTEER_FIELDS = {
+    'id': Field(['id']),
+    'name': Field(['name']),
+    'surnames': Field(['surnames']),
+    'groups': Field(relations=[selectinload('groups').load_only('name')], value=lambda vol: [gr.name for gr in vol.groups]),
+    'role': Field(['role'], [joinedload('role_id').load_only('name')], Volunteer.role_name),
+    'birthday': Field(['birthday']),
+    'document': Field(['document']),
+    'address': Field(['address']),
+    'email': Field(['email']),
+    'phone1': Field(['phone1']),
+    'phone2': Field(['phone2']),
+    'active': Field(['active'])
+}
+VOLUNTEER_TIERS = {
+    'info': ('name', 'surnames', 'groups', 'role', 'active'),
+    'details': ('id', 'name', 'surnames', 'groups', 'role', 'birthday', 'phone1', 'phone2', 'active'),
+    'fullData': ('id', 'name', 'surnames', 'groups', 'role', 'birthday', 'document', 'address', 'email', 'phone1', 'phone2', 'active')
+}
+SERVICE_FIELDS = {
+    'id': Field(['id']),
+    'name': Field(['name']),
+    'place': Field(['place']),
+    'date': Field(['date']),
+    'duration': Field(['duration']),
+    'vehicles_num': Field(['vehicles_num']),
+    'vehicles': Field(relations=[selectinload('vehicles').load_only('name', 'year')], value=Service.vehicles_info),
+    'volunteers_num': Field(['volunteers_num']),
+    'volunteers': Field(relations=[selectinload('volunteers').load_only('name', 'surnames', 'role')], value=Service.volunteers_info),
+    'contact_name': Field(['contact_name']),
+    'contact_phone': Field(['contact_phone'])
+}
+SERVICE_TIERS = {
+    'info': ('name', 'place', 'date'),
+    'details': ('id', 'name', 'place', 'date', 'duration', 'vehicles_num', 'vehicles', 'volunteers_num', 'volunteers'),
+    'fullData': ('id', 'name', 'place', 'date', 'duration', 'vehicles_num', 'vehicles', 'volunteers_num', 'volunteers', 'contact_name', 'contact_phone')
+}
+
 class Group(db.Model):
     __tablename__ = 'groups'
 
@@ -254,19 +556,20 @@ class Group(db.Model):
     def insert(self):
       db.session.add(self)
       db.session.commit()
+      names_cache.invalidate()
 
     def update(self):
       db.session.commit()
+      names_cache.invalidate()
 
     def delete(self):
       db.session.delete(self)
       db.session.commit()
+      names_cache.invalidate()
 
     def info(self):
-        roles_list = {
-          rol.id: rol.name for rol in Role.query.all()
-        }
-        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'role': roles_list[vol.role] } for vol in self.volunteers]
+        roles_list = role_names()
+        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'role': roles_list.get(vol.role, 'Volunteer') } for vol in self.volunteers]
         return {
             'id': self.id,
             'name': self.name,
@@ -288,21 +591,132 @@ class Role(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        names_cache.invalidate()
 
     def update(self):
         db.session.commit()
+        names_cache.invalidate()
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        names_cache.invalidate()
 
     def info(self):
-        groups_list = {
-          gr.id: gr.name for gr in Group.query.all()
-        }
-        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'groups': [ groups_list[gr.id] for gr in vol.groups] } for vol in self.volunteers]
+        volunteers_list = [{ 'name': f'{vol.name} {vol.surnames}', 'groups': [gr.name for gr in vol.groups] } for vol in self.volunteers]
         return {
             'id': self.id,
             'name': self.name,
             'volunteers': volunteers_list,
         }
+
+
+class TableVersion(db.Model):
+    """Change counter of each resource table, bumped in the same transaction as its writes."""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+VERSIONED_TABLES = ('volunteers', 'vehicles', 'services', 'groups', 'roles')
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def create_table_versions(table, connection, **kwargs):
+    connection.execute(table.insert(), [{ 'name': name, 'version': 0 } for name in VERSIONED_TABLES])
+
+def bump_table_versions(session, names):
+    session.execute(
+        TableVersion.__table__.update()
+        .where(TableVersion.name.in_(names))
+        .values(version=TableVersion.version + 1)
+    )
+
+@event.listens_for(Session, 'before_flush')
+def bump_changed_tables(session, flush_context, instances):
+    changed_tables = {
+        obj.__tablename__ for obj in chain(session.new, session.deleted)
+        if getattr(obj, '__tablename__', None) in VERSIONED_TABLES
+    } | {
+        obj.__tablename__ for obj in session.dirty
+        if getattr(obj, '__tablename__', None) in VERSIONED_TABLES and session.is_modified(obj)
+    }
+    if changed_tables:
+        bump_table_versions(session, changed_tables)
+
+def table_versions(names):
+    """Current versions of the tables `names`, or None when any of them is not tracked.
+
+    The cached names of the roles and groups written since by other processes are dropped.
+    """
+    versions = dict(db.session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(names)))
+    names_cache.sync(versions)
+    if len(versions) != len(set(names)):
+        return None
+    return versions
+
+class VehicleReadiness(db.Model):
+    """Vehicles assigned to services after their next ITV, kept up to date on vehicles and services writes."""
+    __tablename__ = 'vehicle_readiness'
+
+    service = db.Column(db.Integer, db.ForeignKey('services.id', ondelete="CASCADE"), primary_key=True)
+    vehicle = db.Column(db.Integer, db.ForeignKey('vehicles.id', ondelete="CASCADE"), primary_key=True)
+    service_date = db.Column(db.DateTime, nullable=False, index=True)
+    next_itv = db.Column(db.Date, nullable=False)
+
+def vehicles_expiring(until):
+    """Query of the active vehicles whose next ITV is before `until`, already expired included."""
+    return Vehicle.query.filter(Vehicle.active == True, Vehicle.next_itv <= until).order_by(Vehicle.next_itv, Vehicle.id)
+
+def vehicles_after_itv():
+    """Query of the (service, vehicle, service date, next ITV) links of vehicles assigned to services after their next ITV."""
+    return db.session.query(
+        Service.id, Vehicle.id, Service.date, Vehicle.next_itv
+    ).join(services_vehicles, services_vehicles.c.service == Service.id
+    ).join(Vehicle, Vehicle.id == services_vehicles.c.vehicle
+    ).filter(Vehicle.next_itv < Service.date)
+
+def services_at_risk(since):
+    """Query of the services from `since` on with a vehicle assigned after its next ITV, one row per vehicle.
+
+    Read from the vehicle_readiness table when it is enabled.
+    """
+    if VEHICLE_READINESS_TABLE:
+        query = db.session.query(Service, Vehicle
+        ).join(VehicleReadiness, VehicleReadiness.service == Service.id
+        ).join(Vehicle, Vehicle.id == VehicleReadiness.vehicle
+        ).filter(VehicleReadiness.service_date >= since)
+    else:
+        query = db.session.query(Service, Vehicle
+        ).join(services_vehicles, services_vehicles.c.service == Service.id
+        ).join(Vehicle, Vehicle.id == services_vehicles.c.vehicle
+        ).filter(Service.date >= since, Vehicle.next_itv < Service.date)
+    return query.order_by(Service.date, Service.id, Vehicle.id)
+
+def refresh_vehicle_readiness(connection, services=None, vehicles=None):
+    """Recomputes the vehicle_readiness rows of the `services` and `vehicles` ids, or the whole table without them."""
+    table = VehicleReadiness.__table__
+    delete = table.delete()
+    query = vehicles_after_itv()
+    if services is not None or vehicles is not None:
+        delete = delete.where(or_(table.c.service.in_(services or []), table.c.vehicle.in_(vehicles or [])))
+        query = query.filter(or_(Service.id.in_(services or []), Vehicle.id.in_(vehicles or [])))
+
+    connection.execute(delete)
+    connection.execute(table.insert().from_select(
+        ['service', 'vehicle', 'service_date', 'next_itv'],
+        query.statement
+    ))
+
+@event.listens_for(Session, 'after_flush')
+def refresh_changed_readiness(session, flush_context):
+    if not VEHICLE_READINESS_TABLE:
+        return
+    changed = list(chain(session.new, session.dirty, session.deleted))
+    services = [obj.id for obj in changed if isinstance(obj, Service)]
+    vehicles = [obj.id for obj in changed if isinstance(obj, Vehicle)]
+    if services or vehicles:
+        refresh_vehicle_readiness(session.connection(), services, vehicles)
@@ -1,4 +1,5 @@
-from .models import Group, Role, Service, Vehicle, Volunteer
+from datetime import date, datetime
+from .models import Group, Role, Service, Vehicle, Volunteer, names_cache
 from .setup import db
 
 role_vol = Role(name='Volunteer', volunteers=[])
@@ -36,7 +37,7 @@ def create_dummy_resources():
         brand = 'Leyland',
         license = '1234LRR',
         year = 2015,
-        next_itv = '2022-12-31T00:30:00.000Z',
+        next_itv = date(2022, 12, 31),
         incidents = '',
         active = True
     )
@@ -45,14 +46,14 @@ def create_dummy_resources():
         brand = 'Demers',
         license = '1234ATU',
         year = 2020,
-        next_itv = '2024-06-01T00:30:00.000Z',
+        next_itv = date(2024, 6, 1),
         incidents = 'Scuff marks on right passenger door',
         active = True
     )
     chief = Volunteer(
         name = 'Anna',
         surnames = 'de Aragón',
-        birthday = '2000-06-01',
+        birthday = date(2000, 6, 1),
         document = '12345678-W',
         address = 'Calle de la Suerte, 26',
         email = 'anna@prote.ww',
@@ -65,7 +66,7 @@ def create_dummy_resources():
     squad_leader = Volunteer(
         name = 'Cris',
         surnames = 'Lopez Lopez',
-        birthday = '1983-12-09',
+        birthday = date(1983, 12, 9),
         document = '12345678-W',
         address = 'Calle de la Anunciación, 31',
         email = 'cris@prote.ww',
@@ -78,7 +79,7 @@ def create_dummy_resources():
     manager = Volunteer(
         name = 'David',
         surnames = 'Livingstone Algibez',
-        birthday = '1970-01-01',
+        birthday = date(1970, 1, 1),
         document = '12345678-W',
         address = 'Calle de la Cruz, 1',
         email = 'algibez@prote.ww',
@@ -91,7 +92,7 @@ def create_dummy_resources():
     team_member = Volunteer(
         name = 'Debra',
         surnames = 'Reyes Sternkova',
-        birthday = '1994-08-13',
+        birthday = date(1994, 8, 13),
         document = '12345678-W',
         address = 'Calle de la Vida, 12',
         email = 'debra@prote.ww',
@@ -104,7 +105,7 @@ def create_dummy_resources():
     service1 = Service(
         name = 'Preventive service on football match',
         place = 'Av. de Europa, 15 - Estadio del RFC',
-        date = '2021-08-02, 11:00',
+        date = datetime(2021, 8, 2, 11, 0),
         vehicles = [ambulance],
         vehicles_num = 1,
         contact_name = 'Marcos de la Torre',
@@ -115,7 +116,7 @@ def create_dummy_resources():
     service2 = Service(
         name = 'Preventive service on trail running',
         place = 'Club Polideportivo de la Sirena',
-        date = '2022-04-02, 17:30',
+        date = datetime(2022, 4, 2, 17, 30),
         vehicles = [vir],
         vehicles_num = 1,
         contact_name = 'Alesandra Hoobstabank',
@@ -126,7 +127,7 @@ def create_dummy_resources():
     service3 = Service(
         name = 'Fiestas del pueblo',
         place = 'Av. del Ayuntamiento, S/N',
-        date = '2021-12-31, 19:00',
+        date = datetime(2021, 12, 31, 19, 0),
         vehicles = [ambulance, vir],
         vehicles_num = 2,
         contact_name = 'Yaiza Blanca',
@@ -157,3 +158,4 @@ def db_drop_and_create_all():
     if len(Volunteer.query.all()) == 0:
         # Uncomment it for creating dummy data for testing
         create_dummy_resources()
+    names_cache.invalidate()
@@ -1,6 +1,11 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
 import json
+import os
+import weakref
 from dotenv import load_dotenv, find_dotenv
 from os import environ as env
 
@@ -14,18 +19,122 @@ DB_USER = env.get('DB_USER', 'postgres')
 DB_PWD = env.get('DB_PWD', 'postgres')
 DB_NAME = env.get('DB_NAME', 'postgres')
 DB_TEST_NAME = env.get('DB_TEST_NAME', 'postgres')
+DB_POOL_SIZE = int(env.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(env.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(env.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(env.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = env.get('DB_POOL_PRE_PING', 'true') == 'true'
 DATABASE_URL = env.get('DATABASE_URL')
 DATABASE_URL_FOR_TESTING = env.get('DATABASE_URL_FOR_TESTING')
 TESTING_ACCESS_TOKEN = env.get('TESTING_ACCESS_TOKEN')
 TESTING_ACCESS_LEVEL = env.get('TESTING_ACCESS_LEVEL')
+VEHICLE_READINESS_TABLE = env.get('VEHICLE_READINESS_TABLE') == 'true'
+SERVER_TIMING = env.get('SERVER_TIMING', 'true') == 'true'
+METRICS_TOKEN = env.get('METRICS_TOKEN')
+FAST_JSON = env.get('FAST_JSON', 'true') == 'true'
+QUERY_DETECTOR = env.get('QUERY_DETECTOR') == 'true'
+QUERY_REPEAT_THRESHOLD = int(env.get('QUERY_REPEAT_THRESHOLD', 5))
+SLOW_QUERY_MS = int(env.get('SLOW_QUERY_MS', 100))
+NAMES_CACHE_TTL = int(env.get('NAMES_CACHE_TTL', 60))
 
 database_path = DATABASE_URL or f'postgresql+psycopg2://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_NAME}'
 
-db = SQLAlchemy()
+class CountingQueuePool(QueuePool):
+    """QueuePool that also counts its checkouts and the checkouts that timed out."""
+    def __init__(self, *args, max_overflow=10, **kwargs):
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+        self.max_overflow = max_overflow
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def _do_get(self):
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            self.timeouts += 1
+            raise
+        self.checkouts += 1
+        return connection
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """Keeps track of the engines created and of their connections, to reset their pools on forked workers and report on them."""
+    engines = weakref.WeakSet()
+    connections = weakref.WeakSet()
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        self.engines.add(engine)
+        event.listen(engine, 'connect', track_connection)
+        return engine
+
+def track_connection(dbapi_connection, connection_record):
+    # Only the connections on a socket are shared with the forked processes
+    if hasattr(dbapi_connection, 'fileno'):
+        PooledSQLAlchemy.connections.add(dbapi_connection)
+
+db = PooledSQLAlchemy()
+
+def engine_options(db_path):
+    # SQLite databases are files or memory on the same process, the driver defaults are kept
+    if db_path.startswith('sqlite'):
+        return {}
+    return {
+        'poolclass': CountingQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+def detach_connection(dbapi_connection):
+    """Points the socket of a connection inherited from the parent process at /dev/null.
+
+    Closing the connection then neither ends the session of the parent nor writes on its socket.
+    """
+    devnull = os.open(os.devnull, os.O_RDWR)
+    try:
+        os.dup2(devnull, dbapi_connection.fileno())
+    finally:
+        os.close(devnull)
+
+def reset_pools():
+    """Replaces the pools of every engine by empty ones, on a forked process.
+
+    The connections inherited from the parent process are detached first, so closing them
+    here, or when they are garbage collected, leaves them open for the parent.
+    """
+    for connection in list(PooledSQLAlchemy.connections):
+        if not getattr(connection, 'closed', False):
+            detach_connection(connection)
+    PooledSQLAlchemy.connections.clear()
+    for engine in list(PooledSQLAlchemy.engines):
+        engine.dispose()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_pools)
+
+def pool_stats():
+    stats = []
+    for engine in list(PooledSQLAlchemy.engines):
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        stats.append({
+            'database': engine.url.database,
+            'size': pool.size(),
+            'max_overflow': getattr(pool, 'max_overflow', None),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'checkouts': getattr(pool, 'checkouts', None),
+            'timeouts': getattr(pool, 'timeouts', None)
+        })
+    return stats
 
 def setup_db(app,db_path=database_path ):
     app.config["SQLALCHEMY_DATABASE_URI"] = db_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(db_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
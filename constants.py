@@ -1,3 +1,5 @@
+from config.config import MAX_READINESS_DAYS
+
 ALGORITHMS = 'ALGORITHMS'
 AUTH0_AUDIENCE = 'AUTH0_AUDIENCE'
 AUTH0_CALLBACK_URL = 'AUTH0_CALLBACK_URL'
@@ -11,6 +13,25 @@ DB_NAME = 'DB_NAME'
 DB_PWD = 'DB_PWD'
 DB_TEST_NAME = 'DB_TEST_NAME'
 DB_USER = 'DB_USER'
+DB_POOL_SIZE = 'DB_POOL_SIZE'
+DB_MAX_OVERFLOW = 'DB_MAX_OVERFLOW'
+DB_POOL_TIMEOUT = 'DB_POOL_TIMEOUT'
+DB_POOL_RECYCLE = 'DB_POOL_RECYCLE'
+DB_POOL_PRE_PING = 'DB_POOL_PRE_PING'
+FAST_JSON = 'FAST_JSON'
+JWKS_CACHE_TTL = 'JWKS_CACHE_TTL'
+JWKS_MIN_REFRESH_INTERVAL = 'JWKS_MIN_REFRESH_INTERVAL'
+METRICS_TOKEN = 'METRICS_TOKEN'
+NAMES_CACHE_TTL = 'NAMES_CACHE_TTL'
+QUERY_DETECTOR = 'QUERY_DETECTOR'
+QUERY_REPEAT_THRESHOLD = 'QUERY_REPEAT_THRESHOLD'
+SERVER_TIMING = 'SERVER_TIMING'
+SLOW_QUERY_MS = 'SLOW_QUERY_MS'
+TOKEN_CACHE_SIZE = 'TOKEN_CACHE_SIZE'
+VEHICLE_READINESS_TABLE = 'VEHICLE_READINESS_TABLE'
+WEB_CONCURRENCY = 'WEB_CONCURRENCY'
+WEB_MAX_REQUESTS = 'WEB_MAX_REQUESTS'
+WEB_THREADS = 'WEB_THREADS'
 
 HTTP_RESPONSES = {
     400: 'Bad Request',
@@ -18,6 +39,7 @@ HTTP_RESPONSES = {
     403: 'Forbidden',
     404: 'Not Found',
     405: 'Method not Allowed',
+    409: 'Conflict',
     422: 'Unprocessable Entity',
     500: 'Server Error',
 }
@@ -34,7 +56,8 @@ AUTH_ERROR_MESSAGES = {
     'parsing_failed': 'Unable to parse authentication token.',
     'key_not_found': 'Unable to find the appropriate key.',
     'permissions_failed': 'Unable to check permissions.',
-    'no_permission': 'User has no permission to access the requested content.'
+    'no_permission': 'User has no permission to access the requested content.',
+    'invalid_metrics_token': 'The metrics token is not valid.'
 }
 
 ERROR_MESSAGES = {
@@ -44,15 +67,27 @@ ERROR_MESSAGES = {
     'veh_not_found': 'There are no vehicles with the provided id.',
     'ser_not_found': 'There are no services with the provided id.',
     'body_needed': 'A data object should be sent on the request.',
+    'body_list_needed': 'A list of data objects should be sent on the request.',
+    'bulk_too_large': 'Too many objects were sent on the request. Please split them into smaller requests.',
+    'bulk_invalid': 'At least one of the objects sent is not valid. Please check the errors of each object.',
+    'bulk_dummy_mixed': 'All the objects sent should have the same "dummy_data" value.',
     'missing_data': 'There are missing required data on the object sent.',
     'invalid_role': 'The role id provided in not valid.',
     'invalid_group': 'The group id provided in not valid.',
     'max_groups': 'A volunteer cannot be on more than 5 groups.',
+    'bad_duration': 'The duration of a service should be a positive number of minutes.',
+    'service_conflict': 'Some of the volunteers or vehicles are already assigned to other services at the same time.',
     'invalid_list': 'There is at least one invalid id on the lists provided.',
     'no_change': 'No information was changed on the request.',
     'wrong_type': 'An attribute sent has a wrong type. Please double check all values.',
     'bad_date': 'The date provided is incorrectly formated. Please use [YYYY-MM-DD].',
     'bad_full_date': 'The date provided is incorrectly formated. Please use [YYYY-MM-DD, hh:mm].',
+    'search_needed': 'A text to search should be sent on the "q" parameter.',
+    'bad_days': f'The number of days should be a number from 1 to {MAX_READINESS_DAYS}.',
+    'bad_limit': 'The page limit should be a positive number.',
+    'bad_date_range': 'The date range provided is not valid. Please use [YYYY-MM-DD] on "from" and "to".',
+    'bad_cursor': 'The cursor provided is not valid. Please use the next_cursor returned by the previous page.',
+    'bad_fields': 'At least one of the fields requested is not valid or not available for your user access.',
     'forbidden_del': 'Sorry, this resource is permanent and cannot be deleted.',
     'forbidden_upd': 'Sorry, this resource is permanent and cannot be changed.',
     'forbidden_date_upd': 'This service has already passed and can no longer be changed.',
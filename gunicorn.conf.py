@@ -0,0 +1,56 @@
+"""Gunicorn settings of the production server, used by the Procfile.
+
+Every worker runs `threads` threads, as the requests mostly wait on the database and Auth0,
+and each thread holds at most one connection, so a worker never waits for its pool with
+`threads` up to DB_POOL_SIZE. The app is loaded and the Auth0 signing keys fetched on the
+master process before forking the workers, which inherit them and start with empty connection
+pools. Each worker loads the names of the roles and groups when forked, so the ones restarted
+after `max_requests` start from the current names.
+Keep `workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)` under the `max_connections` of the database.
+"""
+from config.setup import DB_POOL_SIZE
+from os import environ as env
+import multiprocessing
+
+bind = f"0.0.0.0:{env.get('PORT', '8000')}"
+
+# One process per core runs Python in parallel, its threads take turns while they wait
+workers = int(env.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(env.get('WEB_THREADS', DB_POOL_SIZE))
+worker_class = 'gthread'
+
+preload_app = True
+
+# Restarts the workers after some requests, at different times, to release the memory they hold
+max_requests = int(env.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+def when_ready(server):
+    # The master process fetches the signing keys once, before the workers accepting the requests are forked
+    if not server.cfg.preload_app:
+        return
+    from auth.auth import jwks_store
+    if not jwks_store.refresh():
+        server.log.warning('Could not fetch the signing keys from %s, the first requests will retry', jwks_store.url)
+
+def post_fork(server, worker):
+    # The pools were already reset when forking, by config.setup.reset_pools
+    if server.cfg.preload_app:
+        warm_up(server.app.wsgi(), server.log)
+
+def warm_up(app, log):
+    """Loads the names of the roles and groups of a worker, on connections of its own."""
+    from config.models import group_names, role_names
+    from config.setup import db
+
+    with app.app_context():
+        try:
+            role_names()
+            group_names()
+        except Exception:
+            log.exception('Could not load the names of the roles and groups')
+        finally:
+            db.session.remove()
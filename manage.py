@@ -1,12 +1,26 @@
-from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
-from app import app
+from flask.cli import FlaskGroup
+from flask_migrate import Migrate, stamp
+from app import create_app
 from config.models import db
+from config.populate_db import db_drop_and_create_all
+import click
 
-migrate = Migrate(app, db)
-manager = Manager(app)
+def create_manage_app():
+    app = create_app()
+    Migrate(app, db)
+    return app
 
-manager.add_command('db', MigrateCommand)
+manager = FlaskGroup(create_app=create_manage_app)
+
+@manager.command('create-db')
+@click.option('--seed', is_flag=True, help='Drops all the tables and fills them with the sample data.')
+def create_db(seed):
+    """Creates the database tables and marks them as up to date with the migrations."""
+    if seed:
+        db_drop_and_create_all()
+    else:
+        db.create_all()
+    stamp()
 
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager()
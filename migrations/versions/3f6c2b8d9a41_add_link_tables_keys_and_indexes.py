@@ -0,0 +1,140 @@
+"""add link tables keys and indexes
+
+Revision ID: 3f6c2b8d9a41
+Revises:
+Create Date: 2026-10-18 10:12:37.402913
+
+Composite primary keys and reverse-direction indexes on the association
+tables, plus indexes on the columns the list endpoints filter by.
+
+On PostgreSQL every index is built with CREATE INDEX CONCURRENTLY outside of
+the migration transaction, and the primary keys are attached to their
+already built unique indexes, so the tables are never locked for a full
+build. Duplicated or incomplete links are removed first, as they would make
+the unique index builds fail. The invalid indexes left by a failed build are
+dropped and built again when the migration is run again.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2b8d9a41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+LINK_TABLES = (
+    # table, primary key columns, reverse index, reverse column
+    ('volunteer_groups', ('volunteer', 'group'), 'ix_volunteer_groups_group', 'group'),
+    ('services_volunteer', ('service', 'volunteer'), 'ix_services_volunteer_volunteer', 'volunteer'),
+    ('services_vehicles', ('service', 'vehicle'), 'ix_services_vehicles_vehicle', 'vehicle')
+)
+
+COLUMN_INDEXES = (
+    ('ix_services_date', 'services', 'date'),
+    ('ix_volunteers_active', 'volunteers', 'active'),
+    ('ix_vehicles_next_itv', 'vehicles', 'next_itv')
+)
+
+
+def columns_list(columns):
+    return ', '.join('"{}"'.format(column) for column in columns)
+
+
+def remove_invalid_links(table, columns):
+    first, second = columns
+    op.execute('DELETE FROM {table} WHERE "{first}" IS NULL OR "{second}" IS NULL'.format(
+        table=table, first=first, second=second))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            'DELETE FROM {table} a USING {table} b '
+            'WHERE a.ctid > b.ctid AND a."{first}" = b."{first}" AND a."{second}" = b."{second}"'.format(
+                table=table, first=first, second=second))
+    else:
+        op.execute(
+            'DELETE FROM {table} WHERE rowid NOT IN '
+            '(SELECT MIN(rowid) FROM {table} GROUP BY "{first}", "{second}")'.format(
+                table=table, first=first, second=second))
+
+
+def has_primary_key(table):
+    return bool(sa.inspect(op.get_bind()).get_pk_constraint(table).get('constrained_columns'))
+
+
+def has_index(table, name):
+    return any(index['name'] == name for index in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+def drop_invalid_index(name):
+    # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, that IF NOT EXISTS would then skip
+    invalid = op.get_bind().execute(
+        sa.text('SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid'),
+        name=name).first()
+    if invalid:
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+
+
+def create_index_concurrently(name, table, columns, unique=False):
+    drop_invalid_index(name)
+    op.execute('CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})'.format(
+        unique='UNIQUE ' if unique else '', name=name, table=table, columns=columns_list(columns)))
+
+
+def upgrade_postgresql():
+    with op.get_context().autocommit_block():
+        for table, columns, reverse_index, reverse_column in LINK_TABLES:
+            create_index_concurrently('{}_pkey'.format(table), table, columns, unique=True)
+            create_index_concurrently(reverse_index, table, [reverse_column])
+        for index, table, column in COLUMN_INDEXES:
+            create_index_concurrently(index, table, [column])
+
+    for table, columns, _, _ in LINK_TABLES:
+        if not has_primary_key(table):
+            op.execute('ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_pkey'.format(
+                table=table))
+
+
+def upgrade_other():
+    for table, columns, reverse_index, reverse_column in LINK_TABLES:
+        if not has_primary_key(table):
+            with op.batch_alter_table(table, recreate='always') as batch_op:
+                for column in columns:
+                    batch_op.alter_column(column, existing_type=sa.Integer(), nullable=False)
+                batch_op.create_primary_key('{}_pkey'.format(table), list(columns))
+        if not has_index(table, reverse_index):
+            op.create_index(reverse_index, table, [reverse_column])
+    for index, table, column in COLUMN_INDEXES:
+        if not has_index(table, index):
+            op.create_index(index, table, [column])
+
+
+def upgrade():
+    for table, columns, _, _ in LINK_TABLES:
+        remove_invalid_links(table, columns)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        upgrade_postgresql()
+    else:
+        upgrade_other()
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    for index, table, _ in COLUMN_INDEXES:
+        op.drop_index(index, table_name=table)
+
+    for table, columns, reverse_index, _ in LINK_TABLES:
+        op.drop_index(reverse_index, table_name=table)
+        if postgresql:
+            op.execute('ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_pkey'.format(table=table))
+            for column in columns:
+                op.alter_column(table, column, existing_type=sa.Integer(), nullable=True)
+        else:
+            with op.batch_alter_table(table, recreate='always') as batch_op:
+                batch_op.drop_constraint('{}_pkey'.format(table), type_='primary')
+                for column in columns:
+                    batch_op.alter_column(column, existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,42 @@
+"""add table versions
+
+Revision ID: 5a0f8c6e2b17
+Revises: e71a5c3b9d06
+Create Date: 2026-10-18 15:48:33.205671
+
+Change counters behind the ETags of the resources. The table used to be
+created by the db.create_all() run on every start, which the application
+no longer does.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a0f8c6e2b17'
+down_revision = 'e71a5c3b9d06'
+branch_labels = None
+depends_on = None
+
+
+VERSIONED_TABLES = ('volunteers', 'vehicles', 'services', 'groups', 'roles')
+
+
+def upgrade():
+    if 'table_versions' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('table_versions',
+            sa.Column('name', sa.String(length=40), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+    table_versions = sa.table('table_versions', sa.column('name', sa.String), sa.column('version', sa.Integer))
+    existing = { name for name, in op.get_bind().execute(sa.select([table_versions.c.name])) }
+    missing = [{ 'name': name, 'version': 0 } for name in VERSIONED_TABLES if name not in existing]
+    if missing:
+        op.bulk_insert(table_versions, missing)
+
+
+def downgrade():
+    op.drop_table('table_versions')
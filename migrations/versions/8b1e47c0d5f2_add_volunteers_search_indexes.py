@@ -0,0 +1,69 @@
+"""add volunteers search indexes
+
+Revision ID: 8b1e47c0d5f2
+Revises: 3f6c2b8d9a41
+Create Date: 2026-10-18 11:40:05.118274
+
+Indexes used by /volunteers/search: case insensitive prefix indexes on the
+name, surnames, full name and document, prefix indexes on the phones as text and, when
+the pg_trgm extension can be installed, a trigram index on the full name for
+the fuzzy matches.
+
+The expressions must be kept exactly as search_volunteers() builds them, or
+the planner will not use the indexes.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e47c0d5f2'
+down_revision = '3f6c2b8d9a41'
+branch_labels = None
+depends_on = None
+
+
+PREFIX_INDEXES = (
+    ('ix_volunteers_name_prefix', 'lower(name)'),
+    ('ix_volunteers_surnames_prefix', 'lower(surnames)'),
+    ('ix_volunteers_full_name_prefix', "lower(name || ' ' || surnames)"),
+    ('ix_volunteers_document_prefix', 'lower(document)'),
+    ('ix_volunteers_phone1_prefix', 'CAST(phone1 AS TEXT)'),
+    ('ix_volunteers_phone2_prefix', 'CAST(phone2 AS TEXT)')
+)
+
+TRIGRAM_INDEX = 'ix_volunteers_full_name_trgm'
+
+
+def trigrams_available():
+    return op.get_bind().execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").scalar() is not None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for index, expression in PREFIX_INDEXES:
+            op.execute('CREATE INDEX IF NOT EXISTS {index} ON volunteers ({expression})'.format(
+                index=index, expression=expression))
+        return
+
+    with_trigrams = trigrams_available()
+    if with_trigrams:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    with op.get_context().autocommit_block():
+        for index, expression in PREFIX_INDEXES:
+            # text_pattern_ops makes the index usable by LIKE 'prefix%' whatever the collation is
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON volunteers (({expression}) text_pattern_ops)'.format(
+                index=index, expression=expression))
+        if with_trigrams:
+            op.execute(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON volunteers '
+                "USING gin (lower(name || ' ' || surnames) gin_trgm_ops)".format(index=TRIGRAM_INDEX))
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS {}'.format(TRIGRAM_INDEX))
+    for index, _ in PREFIX_INDEXES:
+        op.execute('DROP INDEX IF EXISTS {}'.format(index))
@@ -0,0 +1,32 @@
+"""add services duration
+
+Revision ID: c4d9e2a7f318
+Revises: 8b1e47c0d5f2
+Create Date: 2026-10-18 13:05:51.630447
+
+Duration of the services in minutes, used to find the volunteers and
+vehicles assigned to overlapping services. Existing services get the
+default duration.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d9e2a7f318'
+down_revision = '8b1e47c0d5f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'duration' in [column['name'] for column in sa.inspect(op.get_bind()).get_columns('services')]:
+        return
+    # A constant server default does not rewrite the table on PostgreSQL 11+
+    op.add_column('services', sa.Column('duration', sa.Integer(), nullable=False, server_default='120'))
+
+
+def downgrade():
+    with op.batch_alter_table('services') as batch_op:
+        batch_op.drop_column('duration')
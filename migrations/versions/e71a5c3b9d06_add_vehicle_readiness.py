@@ -0,0 +1,50 @@
+"""add vehicle readiness
+
+Revision ID: e71a5c3b9d06
+Revises: c4d9e2a7f318
+Create Date: 2026-10-18 14:22:19.874512
+
+Precomputed links of the vehicles assigned to services after their next
+ITV, read by /vehicles/readiness when VEHICLE_READINESS_TABLE is enabled.
+The table is filled from the current links, and kept up to date by the
+application on every vehicles and services write.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e71a5c3b9d06'
+down_revision = 'c4d9e2a7f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'vehicle_readiness' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('vehicle_readiness',
+            sa.Column('service', sa.Integer(), nullable=False),
+            sa.Column('vehicle', sa.Integer(), nullable=False),
+            sa.Column('service_date', sa.DateTime(), nullable=False),
+            sa.Column('next_itv', sa.Date(), nullable=False),
+            sa.ForeignKeyConstraint(['service'], ['services.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['vehicle'], ['vehicles.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('service', 'vehicle')
+        )
+        op.create_index('ix_vehicle_readiness_service_date', 'vehicle_readiness', ['service_date'])
+
+    op.execute('DELETE FROM vehicle_readiness')
+    op.execute(
+        'INSERT INTO vehicle_readiness (service, vehicle, service_date, next_itv) '
+        'SELECT services.id, vehicles.id, services.date, vehicles.next_itv '
+        'FROM services '
+        'JOIN services_vehicles ON services_vehicles.service = services.id '
+        'JOIN vehicles ON vehicles.id = services_vehicles.vehicle '
+        'WHERE vehicles.next_itv < services.date'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_vehicle_readiness_service_date', table_name='vehicle_readiness')
+    op.drop_table('vehicle_readiness')
@@ -0,0 +1,276 @@
+"""Shared test fixtures: access tokens signed by a local JWKS and a database on which every
+test runs inside a transaction that is rolled back afterwards.
+
+By default the tests need no network nor database server: the tokens are minted with a
+key generated on the fly and the database is SQLite in memory, one per process, so the
+suites can also run in parallel. Setting DATABASE_URL_FOR_TESTING runs them against that
+database instead, which must have been created with `python manage.py create-db --seed`.
+"""
+from app import create_app
+from config.populate_db import db_drop_and_create_all
+from config.setup import db, DATABASE_URL_FOR_TESTING
+from config.models import names_cache
+from sqlalchemy import event, orm
+from urllib.parse import urljoin
+from urllib.request import pathname2url
+import atexit
+import auth.auth
+import json
+import os
+import rsa
+import tempfile
+import time
+import unittest
+
+TEST_DATABASE_URL = DATABASE_URL_FOR_TESTING or 'sqlite://'
+TEST_AUDIENCE = 'https://civil-defense.test'
+TEST_DOMAIN = 'civil-defense.test'
+TEST_KEY_ID = 'test-key'
+TEST_KEY_PATH = os.path.join(tempfile.gettempdir(), 'civil-defense-test-key.pem')
+TEST_METRICS_TOKEN = 'test-metrics-token'
+
+ACCESS_LEVELS = {
+    'volunteer': [
+        'read:groups',
+        'read:roles',
+        'read:services-details',
+        'read:volunteers',
+        'read:volunteers-own',
+        'update:volunteers-own'
+    ],
+    'manager': [
+        'create:services',
+        'create:volunteers',
+        'read:groups',
+        'read:roles',
+        'read:services-details',
+        'read:services-full',
+        'read:vehicles',
+        'read:volunteers',
+        'read:volunteers-details',
+        'update:services',
+        'update:vehicles',
+        'update:volunteers'
+    ],
+    'admin': [
+        'create:services',
+        'create:vehicles',
+        'create:volunteers',
+        'delete:services',
+        'delete:vehicles',
+        'delete:volunteers',
+        'read:groups',
+        'read:roles',
+        'read:services-details',
+        'read:services-full',
+        'read:vehicles',
+        'read:vehicles-full',
+        'read:volunteers',
+        'read:volunteers-details',
+        'read:volunteers-full',
+        'read:volunteers-own',
+        'update:services',
+        'update:vehicles',
+        'update:volunteers'
+    ]
+}
+
+# region Local JWKS
+def load_test_key(path=TEST_KEY_PATH):
+    """RSA key signing the test tokens, generated once and kept on the temporary directory.
+
+    Generating it takes seconds with the pure Python `rsa` package, longer than the suites.
+    """
+    try:
+        with open(path, 'rb') as key_file:
+            return rsa.PrivateKey.load_pkcs1(key_file.read())
+    except (OSError, ValueError):
+        pass
+
+    _, private_key = rsa.newkeys(2048)
+    # Written to a file of its own first, as parallel suites could be generating it too
+    key_file, key_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(key_file, 'wb') as pem:
+        pem.write(private_key.save_pkcs1())
+    os.replace(key_path, path)
+    return private_key
+
+class LocalJWKS:
+    """Stand-in for the Auth0 JWKS endpoint.
+
+    Generates an RSA key, publishes its public part on a JWKS file and mints RS256 tokens
+    with it. Once installed, `verify_decode_jwt` fetches the keys from that file and expects
+    the audience and issuer of the minted tokens.
+    """
+    def __init__(self, key_id=TEST_KEY_ID, audience=TEST_AUDIENCE, domain=TEST_DOMAIN):
+        # Imported here, as the slowest import of the app is only needed by the suites minting tokens
+        from jose import jwk
+
+        self.key_id = key_id
+        self.audience = audience
+        self.domain = domain
+        private_key = load_test_key()
+        self.private_key = private_key.save_pkcs1().decode()
+        public_key = rsa.PublicKey(private_key.n, private_key.e)
+        public_jwk = jwk.construct(public_key.save_pkcs1().decode(), 'RS256').to_dict()
+
+        jwks_file, self.path = tempfile.mkstemp(prefix='jwks-', suffix='.json')
+        with os.fdopen(jwks_file, 'w') as jwks:
+            json.dump({ 'keys': [{ **public_jwk, 'kid': key_id, 'use': 'sig' }] }, jwks)
+        self.url = urljoin('file:', pathname2url(self.path))
+        self._replaced = None
+
+    def token(self, permissions=(), expires_in=3600, **claims):
+        from jose import jwt
+
+        now = int(time.time())
+        return jwt.encode({
+            'iss': f'{auth.auth.PROTOCOL}://{self.domain}/',
+            'sub': 'auth0|test',
+            'aud': self.audience,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions),
+            **claims
+        }, self.private_key, algorithm='RS256', headers={ 'kid': self.key_id })
+
+    def install(self):
+        if self._replaced is None:
+            self._replaced = {
+                'AUTH0_AUDIENCE': auth.auth.AUTH0_AUDIENCE,
+                'AUTH0_DOMAIN': auth.auth.AUTH0_DOMAIN,
+                'ALGORITHMS': auth.auth.ALGORITHMS,
+                'url': auth.auth.jwks_store.url
+            }
+        auth.auth.AUTH0_AUDIENCE = self.audience
+        auth.auth.AUTH0_DOMAIN = self.domain
+        auth.auth.ALGORITHMS = ['RS256']
+        auth.auth.jwks_store.url = self.url
+        auth.auth.jwks_store.clear()
+        auth.auth.token_cache.clear()
+
+    def uninstall(self):
+        if self._replaced is None:
+            return
+        auth.auth.AUTH0_AUDIENCE = self._replaced['AUTH0_AUDIENCE']
+        auth.auth.AUTH0_DOMAIN = self._replaced['AUTH0_DOMAIN']
+        auth.auth.ALGORITHMS = self._replaced['ALGORITHMS']
+        auth.auth.jwks_store.url = self._replaced['url']
+        auth.auth.jwks_store.clear()
+        auth.auth.token_cache.clear()
+        self._replaced = None
+
+    def close(self):
+        self.uninstall()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+local_jwks = None
+
+def get_local_jwks():
+    """The JWKS stand-in of this process, installed on the first call."""
+    global local_jwks
+    if local_jwks is None:
+        local_jwks = LocalJWKS()
+        local_jwks.install()
+        atexit.register(local_jwks.close)
+    return local_jwks
+
+def access_token(access_level):
+    """Token minted for the permissions of `access_level`, or None for an unknown level."""
+    if access_level not in ACCESS_LEVELS:
+        return None
+    return get_local_jwks().token(ACCESS_LEVELS[access_level])
+# endregion
+
+# region Database
+test_app = None
+
+def get_test_app():
+    """The app shared by every test of this process, with its database created and seeded."""
+    global test_app
+    if test_app is None:
+        test_app = create_app({ 'database_path': TEST_DATABASE_URL, 'query_detector': True, 'metrics_token': TEST_METRICS_TOKEN })
+        with test_app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                enable_sqlite_savepoints(db.engine)
+                db_drop_and_create_all()
+            else:
+                db.create_all()
+    return test_app
+
+def enable_sqlite_savepoints(engine):
+    """Lets SQLAlchemy emit the BEGIN statements, as pysqlite breaks the SAVEPOINTs otherwise."""
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):
+        connection.execute('BEGIN')
+
+def restart_savepoint(session, transaction):
+    # The application committed or rolled back the SAVEPOINT of the test, a new one takes its place
+    if transaction.nested and not transaction._parent.nested and not session.info.get('removed'):
+        session.expire_all()
+        session.begin_nested()
+
+class SavepointScopedSession(orm.scoped_session):
+    """Scoped session whose sessions start on a SAVEPOINT, rolled back when they are removed.
+
+    Removing a session without a commit (at the end of each request) discards its changes,
+    as it does outside of the tests.
+    """
+    def remove(self):
+        if self.registry.has():
+            session = self.registry()
+            session.info['removed'] = True
+            session.rollback()
+        super().remove()
+
+class DatabaseTestCase(unittest.TestCase):
+    """Test case whose changes to the database are rolled back after each test.
+
+    Every session of the test is bound to a single connection inside a transaction that
+    is never committed. The commits of the application release SAVEPOINTs instead.
+    The tests whose requests issue more SQL statements than the `query_budget` of their
+    routes fail.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.app = get_test_app()
+        cls.db = db
+
+    def setUp(self):
+        self.client = self.app.test_client
+        self.query_detector = self.app.extensions['query_detector']
+        self.query_detector.violations.clear()
+
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+
+        session_factory = db.create_session({ 'bind': self.connection, 'binds': {}, 'query_cls': db.Query })
+        event.listen(session_factory, 'after_transaction_end', restart_savepoint)
+
+        def begin_session():
+            session = session_factory()
+            session.begin_nested()
+            return session
+
+        self.app_session = db.session
+        db.session = SavepointScopedSession(begin_session)
+
+    def tearDown(self):
+        db.session.remove()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
+
+        # The in-memory caches could keep data of the rolled back changes
+        names_cache.invalidate()
+        self.app.extensions['public_services_cache'].clear()
+
+        if self.query_detector.violations:
+            self.fail('Query budgets exceeded:\n' + '\n'.join(self.query_detector.violations))
+# endregion
@@ -1,12 +1,16 @@
-from flask_sqlalchemy import SQLAlchemy, request
-from app import create_app
-from config.setup import setup_db, DATABASE_URL_FOR_TESTING, DB_HOST, DB_PWD, DB_TEST_NAME, DB_USER, TESTING_ACCESS_LEVEL, TESTING_ACCESS_TOKEN
-from config.models import Volunteer, Service
+from config.setup import db, TESTING_ACCESS_LEVEL, TESTING_ACCESS_TOKEN
+from config.models import Volunteer, Vehicle, VehicleReadiness, Service, Group, Role, SERVICE_FIELDS, SERVICE_TIERS, VOLUNTEER_FIELDS, VOLUNTEER_TIERS, bulk_insert_volunteers, bump_table_versions, fetch_by_ids, refresh_vehicle_readiness, vehicles_after_itv, names_cache, group_names, role_names, table_versions, volunteer_groups, search_volunteers, service_conflicts, services_between, services_staffing
+import base64
 import os
 import unittest
+from unittest import mock
 import json
 import constants
 from copy import deepcopy
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from tests.fixtures import DatabaseTestCase, access_token, TEST_METRICS_TOKEN
+from utils.fields import serialize_fields
 
 # Test suites are fully executed from Postman. Here's just a reduced sample.
 
@@ -47,32 +51,58 @@ created_volunteer_id = None
 created_vehicle_id = None
 created_service_id = None
 
+def insert_mock_volunteer():
+    volunteer = Volunteer(**{ **mock_volunteer, 'birthday': datetime.strptime(mock_volunteer['birthday'], '%Y-%m-%d').date(), 'active': True, 'groups': [] })
+    volunteer.insert()
+    return volunteer
+
+def insert_mock_vehicle():
+    vehicle = Vehicle(**{ **mock_vehicle, 'next_itv': datetime.strptime(mock_vehicle['next_itv'], '%Y-%m-%d').date() })
+    vehicle.insert()
+    return vehicle
+
+def insert_mock_service():
+    # Services in the past cannot be changed
+    service = Service(**{ **mock_service, 'date': datetime.now().replace(second=0, microsecond=0) + timedelta(days=30), 'vehicles': [], 'volunteers': [] })
+    service.insert()
+    return service
+
+# Without a real token, one is minted locally for the access level (admin by default)
+if not TESTING_ACCESS_TOKEN:
+    TESTING_ACCESS_LEVEL = TESTING_ACCESS_LEVEL or 'admin'
+    TESTING_ACCESS_TOKEN = access_token(TESTING_ACCESS_LEVEL)
+
 if TESTING_ACCESS_TOKEN:
     headers = {
         'Authorization': f'Bearer {TESTING_ACCESS_TOKEN}'
     }
 
-class AppTesting(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_path = DATABASE_URL_FOR_TESTING or f'postgresql+psycopg2://{DB_USER}:{DB_PWD}@{DB_HOST}/{DB_TEST_NAME}'
-        setup_db(self.app, self.database_path)
-
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            self.db.create_all()
-
-    def tearDown(self):
-        """Executed after each test"""
-        pass
-
+class AppTesting(DatabaseTestCase):
     def test_ping(self):
         """[GET:/] server is up :D"""
         res = self.client().get('/')
         self.assertEqual(res.status_code, 200)
 
+    def test_metrics(self):
+        """[GET:/metrics] requests are timed and their queries counted"""
+        res = self.client().get('/services/1', headers=headers)
+        status = res.status_code
+        timings = res.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('app;dur='))
+        self.assertTrue(timings[1].startswith('db;dur='))
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 401)
+        res = self.client().get('/metrics', headers={ 'Authorization': 'Bearer not-the-token' })
+        self.assertEqual(res.status_code, 401)
+
+        res = self.client().get('/metrics', headers={ 'Authorization': f'Bearer {TEST_METRICS_TOKEN}' })
+        text = res.data.decode()
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(f'http_responses_total{{method="GET",endpoint="/services/<int:id>",status="{status}"}}', text)
+        self.assertIn('http_request_db_queries_count{method="GET",endpoint="/services/<int:id>"}', text)
+        self.assertIn('cache_lookups_total{cache="tokens",result="hit"}', text)
+
 # region VOLUNTEERS
     def test_read_one_volunteer(self):
         """[volunteers] read one volunteer"""
@@ -115,6 +145,78 @@ class AppTesting(unittest.TestCase):
             self.assertFalse(data['success'])
             self.assertEqual(data['error'], constants.HTTP_RESPONSES[404])
 
+    def test_read_volunteers_fields(self):
+        """[volunteers] read only the fields requested of all volunteers"""
+        res = self.client().get('/volunteers?fields=id,name,surnames', headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            # The id is not written for the volunteers access
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], constants.ERROR_MESSAGES['bad_fields'])
+            self.assertEqual(data['invalid_fields'], ['id'])
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(set(data['volunteers'][0].keys()), { 'id', 'name', 'surnames' })
+            self.assertEqual(data['volunteers'][0]['name'], 'Anna')
+
+    def test_volunteers_fields_match_serializers(self):
+        """[volunteers] the fields of each access tier are the ones written by its serializer"""
+        with self.app.app_context():
+            volunteer = Volunteer.query.get(1)
+            for tier, fields in VOLUNTEER_TIERS.items():
+                self.assertEqual(serialize_fields(volunteer, VOLUNTEER_FIELDS, fields), getattr(volunteer, tier)())
+
+    def test_fetch_volunteers_by_ids(self):
+        """[volunteers] fetch volunteers by ids keeping their order and reporting missing ids"""
+        with self.app.app_context():
+            volunteers, missing = fetch_by_ids(Volunteer, [3, 9999, 1, 'x'])
+            self.assertEqual([vol.id for vol in volunteers], [3, 1])
+            self.assertEqual(missing, [9999, 'x'])
+
+    def test_search_volunteers_ranks_best_matches_first(self):
+        """[volunteers] search volunteers by the start of their names, ignoring case"""
+        with self.app.app_context():
+            volunteers = search_volunteers('ANNA').all()
+            self.assertGreaterEqual(len(volunteers), 1)
+            self.assertEqual(volunteers[0].name, 'Anna')
+
+            volunteers = search_volunteers('livings').all()
+            self.assertIn('Livingstone Algibez', [vol.surnames for vol in volunteers])
+            self.assertEqual(search_volunteers('%').all(), [])
+
+    def test_search_volunteers_by_full_name(self):
+        """[volunteers] search volunteers by the start of their full names"""
+        with self.app.app_context():
+            volunteers = search_volunteers('Anna de Ar').all()
+            self.assertGreaterEqual(len(volunteers), 1)
+            self.assertEqual((volunteers[0].name, volunteers[0].surnames), ('Anna', 'de Aragón'))
+
+    def test_search_volunteers(self):
+        """[volunteers] search volunteers"""
+        res = self.client().get('/volunteers/search?q=anna&limit=1', headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[401])
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[403])
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertTrue(data['success'])
+            self.assertEqual(len(data['volunteers']), 1)
+            self.assertEqual(data['volunteers'][0]['name'], 'Anna')
+
+            res = self.client().get('/volunteers/search?q=', headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], constants.ERROR_MESSAGES['search_needed'])
+
     def test_create_a_volunteer(self):
         """[volunteers] create a volunteer"""
         global created_volunteer_id
@@ -135,6 +237,112 @@ class AppTesting(unittest.TestCase):
             self.assertTrue(data['created'])
             self.assertEqual(data['volunteer']['name'], mock_volunteer['name'])
 
+    def test_create_a_volunteer_with_repeated_groups(self):
+        """[volunteers] create a volunteer with a group repeated"""
+        res = self.client().post('/volunteers', json={ **mock_volunteer, 'groups': [1, 1] }, headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(len(data['volunteer']['groups']), 1)
+
+    def test_create_a_volunteer_with_a_text_role(self):
+        """[volunteers] create a volunteer with the id of its role as text"""
+        res = self.client().post('/volunteers', json={ **mock_volunteer, 'role': '3' }, headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(data['volunteer']['role'], 'Manager')
+
+    def test_create_volunteers_in_bulk(self):
+        """[volunteers] validate many volunteers in bulk without creating them"""
+        bulk_volunteers = [dict(deepcopy(mock_volunteer), dummy_data=True) for _ in range(3)]
+        bulk_volunteers[2]['role'] = 9999
+        res = self.client().post('/volunteers/bulk', json=bulk_volunteers, headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[401])
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[403])
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['errors'], [{ 'index': 2, 'message': constants.ERROR_MESSAGES['invalid_role'] }])
+
+            wrong_types = deepcopy(bulk_volunteers)
+            wrong_types[0]['role'] = [3]
+            wrong_types[1]['groups'] = [1, [2]]
+            res = self.client().post('/volunteers/bulk', json=wrong_types, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['errors'], [
+                { 'index': 0, 'message': constants.ERROR_MESSAGES['wrong_type'] },
+                { 'index': 1, 'message': constants.ERROR_MESSAGES['wrong_type'] },
+                { 'index': 2, 'message': constants.ERROR_MESSAGES['invalid_role'] }
+            ])
+
+            del bulk_volunteers[2]['role']
+            mixed_volunteers = deepcopy(bulk_volunteers)
+            del mixed_volunteers[1]['dummy_data']
+            res = self.client().post('/volunteers/bulk', json=mixed_volunteers, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], constants.ERROR_MESSAGES['bulk_dummy_mixed'])
+
+            res = self.client().post('/volunteers/bulk', json=bulk_volunteers, headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertFalse(data['created'])
+            self.assertEqual(len(data['volunteers']), 3)
+
+    def test_create_volunteers_in_bulk_for_real(self):
+        """[volunteers] create many volunteers in bulk"""
+        bulk_volunteers = [dict(deepcopy(mock_volunteer), name=f'Lara {index}') for index in range(3)]
+        bulk_volunteers[1]['groups'] = [2]
+        res = self.client().post('/volunteers/bulk', json=bulk_volunteers, headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 201)
+            self.assertTrue(data['created'])
+            self.assertEqual([vol['name'] for vol in data['volunteers']], ['Lara 0', 'Lara 1', 'Lara 2'])
+            self.assertEqual(len(data['volunteers'][1]['groups']), 1)
+
+    def test_bulk_insert_matches_the_returned_ids(self):
+        """[volunteers] the ids returned by a multi-row insert are matched to their rows"""
+        with self.app.app_context():
+            row = {
+                'name': 'Lara', 'surnames': 'Croft', 'birthday': datetime(1994, 7, 21).date(), 'document': '',
+                'address': 'Baskerville St. 221b', 'email': None, 'phone1': 12345678, 'phone2': None, 'active': True, 'role': 3
+            }
+            rows = [dict(row, name=f'Lara {index}', groups=[index % 4 + 1]) for index in range(5)]
+            # The same values with other groups
+            rows += [dict(row, groups=[1]), dict(row, groups=[2, 3])]
+
+            new_ids = bulk_insert_volunteers(rows)
+            self.assertEqual(len(set(new_ids)), len(rows))
+            for new_id, row in zip(new_ids, rows):
+                volunteer = Volunteer.query.get(new_id)
+                self.assertEqual(volunteer.name, row['name'])
+                self.assertEqual(sorted(group.id for group in volunteer.groups), row['groups'])
+
     def test_update_a_volunteer(self):
         """[volunteers] updates a volunteer"""
         global created_volunteer_id
@@ -166,8 +374,9 @@ class AppTesting(unittest.TestCase):
     def test_delete_a_volunteer(self):
         """[volunteers] deletes a volunteer"""
         global created_volunteer_id
-        if not created_volunteer_id:
-            created_volunteer_id =  2
+        # Each test is rolled back, the volunteer created by another test may not exist
+        if not Volunteer.query.filter(Volunteer.id==created_volunteer_id).one_or_none():
+            created_volunteer_id = insert_mock_volunteer().id
 
         res = self.client().delete(f'/volunteers/{created_volunteer_id}', headers=headers)
 
@@ -186,6 +395,47 @@ class AppTesting(unittest.TestCase):
 # endregion
 
 
+# region ROLES
+    def test_names_cache_is_invalidated_on_role_changes(self):
+        """[roles] cached role names are invalidated when roles change"""
+        with self.app.app_context():
+            role_names()
+            version = names_cache.version
+            new_role = Role(name='Dispatcher', volunteers=[])
+            new_role.insert()
+            self.assertEqual(names_cache.version, version + 1)
+            self.assertEqual(role_names()[new_role.id], 'Dispatcher')
+
+            new_role_id = new_role.id
+            new_role.delete()
+            self.assertEqual(names_cache.version, version + 2)
+            self.assertNotIn(new_role_id, role_names())
+
+    def test_names_cache_follows_writes_of_other_processes(self):
+        """[roles] cached role names are dropped when the roles counter moves"""
+        with self.app.app_context():
+            table_versions(['roles'])
+            role_names()
+            # Written by another worker: its cache is invalidated, not this one
+            new_role_id = db.session.execute(Role.__table__.insert().values(name='Dispatcher')).inserted_primary_key[0]
+            bump_table_versions(db.session, ['roles'])
+            self.assertNotIn(new_role_id, role_names())
+
+            table_versions(['roles'])
+            self.assertEqual(role_names()[new_role_id], 'Dispatcher')
+
+    def test_role_info_with_groups_not_cached(self):
+        """[roles] groups missing from the cached names are serialized with their own names"""
+        with self.app.app_context():
+            group_names()
+            role = Role.query.filter(Role.volunteers.any()).first()
+            new_group_id = db.session.execute(Group.__table__.insert().values(name='Divers')).inserted_primary_key[0]
+            db.session.execute(volunteer_groups.insert().values(volunteer=role.volunteers[0].id, group=new_group_id))
+            db.session.expire_all()
+            self.assertIn('Divers', role.info()['volunteers'][0]['groups'])
+# endregion
+
+
 # region VEHICLES
     def test_read_one_vehicle(self):
         """[vehicles] read one vehicle"""
@@ -204,6 +454,60 @@ class AppTesting(unittest.TestCase):
             self.assertTrue(data['success'])
             self.assertEqual(data['vehicle']['name'], 'Ambulance Type 1')
 
+    def test_read_vehicles_readiness(self):
+        """[vehicles] read the vehicles with their ITV about to expire"""
+        res = self.client().get('/vehicles/readiness?days=30', headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[401])
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[403])
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertTrue(data['success'])
+            for veh in data['expiring_vehicles']:
+                self.assertLessEqual(veh['days_left'], 30)
+                self.assertTrue(veh['active'])
+
+            for days in ('0', '99999999999'):
+                res = self.client().get(f'/vehicles/readiness?days={days}', headers=headers)
+                data = json.loads(res.data)
+                self.assertEqual(res.status_code, 400)
+                self.assertEqual(data['message'], constants.ERROR_MESSAGES['bad_days'])
+
+    def test_vehicle_readiness_table_matches_links(self):
+        """[vehicles] the precomputed readiness table has the same links as the live query"""
+        with self.app.app_context():
+            refresh_vehicle_readiness(self.db.session.connection())
+            precomputed = self.db.session.query(VehicleReadiness.service, VehicleReadiness.vehicle).all()
+            live = [(service, vehicle) for service, vehicle, _, _ in vehicles_after_itv()]
+            self.db.session.rollback()
+
+            self.assertEqual(sorted(precomputed), sorted(live))
+
+    def test_vehicle_readiness_table_follows_vehicle_writes(self):
+        """[vehicles] the precomputed readiness table is refreshed when a vehicle is written"""
+        with self.app.app_context(), mock.patch('config.models.VEHICLE_READINESS_TABLE', True):
+            refresh_vehicle_readiness(self.db.session.connection())
+            service = Service.query.filter(Service.vehicles.any()).first()
+            vehicle = service.vehicles[0]
+
+            def readiness():
+                return self.db.session.query(VehicleReadiness).filter_by(service=service.id, vehicle=vehicle.id).one_or_none()
+
+            vehicle.next_itv = (service.date - timedelta(days=1)).date()
+            self.db.session.flush()
+            self.assertEqual(readiness().next_itv, vehicle.next_itv)
+
+            vehicle.next_itv = (service.date + timedelta(days=1)).date()
+            self.db.session.flush()
+            self.assertIsNone(readiness())
+            self.db.session.rollback()
+
     def test_create_a_vehicle(self):
         """[vehicles] read one vehicle with invalid id"""
         global created_vehicle_id
@@ -251,8 +555,8 @@ class AppTesting(unittest.TestCase):
     def test_delete_a_vehicle(self):
         """[vehicles] deletes a vehicle"""
         global created_vehicle_id
-        if not created_vehicle_id:
-            created_vehicle_id =  2
+        if not Vehicle.query.filter(Vehicle.id==created_vehicle_id).one_or_none():
+            created_vehicle_id = insert_mock_vehicle().id
         res = self.client().delete(f'/vehicles/{created_vehicle_id}', headers=headers)
 
         if not TESTING_ACCESS_TOKEN:
@@ -295,6 +599,213 @@ class AppTesting(unittest.TestCase):
             self.assertIn('contact_name', data['services'][0].keys())
             self.assertIn('contact_phone', data['services'][0].keys())
 
+    def test_read_services_by_pages(self):
+        """[services] read services page by page"""
+        res = self.client().get('/services?limit=1', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['services']), 1)
+        self.assertIsNotNone(data['next_cursor'])
+
+        res = self.client().get(f'/services?limit=1&cursor={data["next_cursor"]}', headers=headers)
+        next_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(next_data['services']), 1)
+        self.assertNotEqual(next_data['services'][0], data['services'][0])
+
+    def test_stream_services(self):
+        """[services] stream all services as NDJSON"""
+        res = self.client().get('/services', headers={**headers, 'Accept': 'application/x-ndjson'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+
+        services = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertGreaterEqual(len(services), 3)
+        self.assertIn('name', services[0].keys())
+
+    def test_read_services_fields(self):
+        """[services] read only the fields requested of all services, with only their columns"""
+        res = self.client().get('/services?fields=name,date', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['services'][0].keys()), { 'name', 'date' })
+
+        res = self.client().get('/services?fields=id,volunteers&limit=1', headers=headers)
+        data = json.loads(res.data)
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['invalid_fields'], ['id', 'volunteers'])
+        else:
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(set(data['services'][0].keys()), { 'id', 'volunteers' })
+            self.assertIn('role', data['services'][0]['volunteers'][0].keys())
+            self.assertIsNotNone(data['next_cursor'])
+
+    def test_services_fields_match_serializers(self):
+        """[services] the fields of each access tier are the ones written by its serializer"""
+        with self.app.app_context():
+            service = Service.query.get(1)
+            for tier, fields in SERVICE_TIERS.items():
+                self.assertEqual(serialize_fields(service, SERVICE_FIELDS, fields), getattr(service, tier)())
+
+    def test_read_services_not_modified(self):
+        """[services] read services again with the ETag received"""
+        res = self.client().get('/services', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.headers.get('ETag'))
+
+        res = self.client().get('/services', headers={**headers, 'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_read_public_services_from_cache(self):
+        """[services] public services are served from the responses cache"""
+        cache = self.app.extensions['public_services_cache']
+        res = self.client().get('/services')
+        hits = cache.stats()['hits']
+
+        cached_res = self.client().get('/services')
+        self.assertEqual(cached_res.status_code, 200)
+        self.assertEqual(cached_res.data, res.data)
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+        self.assertIn('max-age', cached_res.headers['Cache-Control'])
+
+    def test_public_services_cache_follows_writes_of_other_processes(self):
+        """[services] cached public services are not served once the services counter moves"""
+        cache = self.app.extensions['public_services_cache']
+        self.client().get('/services')
+        with self.app.app_context():
+            # Written by another worker: this one's cache is not cleared
+            bump_table_versions(db.session, ['services'])
+            db.session.commit()
+        hits = cache.stats()['hits']
+
+        res = self.client().get('/services')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(cache.stats()['hits'], hits)
+
+    def test_read_services_with_invalid_cursor(self):
+        """[services] read services with an invalid cursor"""
+        res = self.client().get('/services?cursor=not-a-cursor', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], constants.ERROR_MESSAGES['bad_cursor'])
+
+        # Out of range, float and boolean ids
+        for id in ['1e999', '1.5', 'true', str(2 ** 63)]:
+            cursor = base64.urlsafe_b64encode(f'["2021-12-01T00:00:00", {id}]'.encode()).decode()
+            res = self.client().get(f'/services?cursor={cursor}', headers=headers)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], constants.ERROR_MESSAGES['bad_cursor'])
+
+    def test_read_services_in_date_range(self):
+        """[services] read the services between two dates, both included"""
+        res = self.client().get('/services?from=2021-12-01&to=2021-12-31', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(len(data['services']), 1)
+
+        dates = [parsedate_to_datetime(ser['date']).replace(tzinfo=None) for ser in data['services']]
+        self.assertEqual(dates, sorted(dates))
+        for date in dates:
+            self.assertGreaterEqual(date, datetime(2021, 12, 1))
+            self.assertLess(date, datetime(2022, 1, 1))
+
+    def test_read_upcoming_services(self):
+        """[services] read only the services from today on"""
+        res = self.client().get('/services?upcoming=1', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        for ser in data['services']:
+            self.assertGreaterEqual(parsedate_to_datetime(ser['date']).replace(tzinfo=None), today)
+
+    def test_read_services_with_invalid_date_range(self):
+        """[services] read services with an incorrectly formated date"""
+        res = self.client().get('/services?from=01-12-2021', headers=headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], constants.ERROR_MESSAGES['bad_date_range'])
+
+    def test_services_date_range_uses_index(self):
+        """[services] the date range query is served by the services date index"""
+        with self.app.app_context():
+            query = services_between(Service.query, datetime(2021, 12, 1), datetime(2022, 1, 1))
+            statement = query.order_by(Service.date, Service.id).limit(101).statement
+            compiled = statement.compile()
+
+            if self.db.engine.dialect.name == 'postgresql':
+                # The sample tables are tiny, so make the planner show the plan it would use on a real table
+                self.db.session.execute('SET LOCAL enable_seqscan = off')
+                plan = '\n'.join(row[0] for row in self.db.session.execute(f'EXPLAIN {compiled}', compiled.params))
+            else:
+                plan = '\n'.join(row[-1] for row in self.db.session.execute(f'EXPLAIN QUERY PLAN {compiled}', compiled.params))
+            self.db.session.rollback()
+
+            self.assertIn('ix_services_date', plan)
+            self.assertNotIn('Seq Scan', plan)
+
+    def test_services_staffing_counts_links(self):
+        """[services] count the volunteers and vehicles assigned to each service"""
+        with self.app.app_context():
+            for row in services_staffing():
+                service = Service.query.get(row.id)
+                self.assertEqual(row.volunteers_assigned, len(service.volunteers))
+                self.assertEqual(row.vehicles_assigned, len(service.vehicles))
+
+            for row in services_staffing(understaffed=True):
+                self.assertTrue(row.volunteers_assigned < row.volunteers_num or row.vehicles_assigned < row.vehicles_num)
+
+    def test_read_services_staffing(self):
+        """[services] read the staffing of the services"""
+        res = self.client().get('/services/staffing?understaffed=1', headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[401])
+        else:
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['success'])
+            for ser in data['services']:
+                self.assertTrue(ser['volunteers_vacancies'] > 0 or ser['vehicles_vacancies'] > 0)
+
+    def test_service_conflicts_with_assigned_vehicles(self):
+        """[services] find the services overlapping with the same vehicles"""
+        with self.app.app_context():
+            service = Service.query.get(3)
+            vehicles = [veh.id for veh in service.vehicles]
+            starts_later = service.date + timedelta(minutes=service.duration - 1)
+
+            conflicts = service_conflicts(None, starts_later, 60, [], vehicles)
+            self.assertEqual(conflicts['volunteers'], {})
+            self.assertEqual(conflicts['vehicles'], { id: [3] for id in vehicles })
+
+            conflicts = service_conflicts(None, starts_later + timedelta(minutes=1), 60, [], vehicles)
+            self.assertEqual(conflicts['vehicles'], {})
+
+    def test_read_conflicts(self):
+        """[services] read the volunteers and vehicles assigned to overlapping services"""
+        res = self.client().get('/conflicts?from=2021-01-01&to=2022-12-31', headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[401])
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['error'], constants.HTTP_RESPONSES[403])
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(data['success'])
+            for conflict in data['conflicts']:
+                self.assertEqual(len(conflict['services']), 2)
+
     def test_read_one_service(self):
         """[services] read one service"""
         res = self.client().get('/services/1', headers=headers)
@@ -356,7 +867,7 @@ class AppTesting(unittest.TestCase):
         updated_mock_service['volunteers'] = [1]
         service_on_db = Service.query.filter(Service.id==created_service_id).one_or_none()
         if not service_on_db:
-            created_service_id = 3
+            created_service_id = insert_mock_service().id
 
         res = self.client().patch(f'/services/{created_service_id}', json=updated_mock_service, headers=headers)
         data = json.loads(res.data)
@@ -377,11 +888,32 @@ class AppTesting(unittest.TestCase):
         # Reset test changes
         self.client().patch(f'/services/{created_service_id}', json=mock_service, headers=headers)
 
+    def test_update_a_service_with_repeated_ids(self):
+        """[services] updates a service with repeated volunteers and vehicles"""
+        service = insert_mock_service()
+        updated_mock_service = {
+            **mock_service,
+            'date': service.date.strftime('%Y-%m-%d, %H:%M'),
+            'volunteers': [1, 1],
+            'vehicles': [2, 2]
+        }
+        res = self.client().patch(f'/services/{service.id}', json=updated_mock_service, headers=headers)
+        data = json.loads(res.data)
+
+        if not TESTING_ACCESS_TOKEN:
+            self.assertEqual(res.status_code, 401)
+        elif TESTING_ACCESS_TOKEN and TESTING_ACCESS_LEVEL == 'volunteer':
+            self.assertEqual(res.status_code, 403)
+        elif TESTING_ACCESS_TOKEN and (TESTING_ACCESS_LEVEL == 'manager' or TESTING_ACCESS_LEVEL == 'admin'):
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(data['service']['volunteers']), 1)
+            self.assertEqual(len(data['service']['vehicles']), 1)
+
     def test_delete_a_service(self):
         """[services] deletes a service"""
         global created_service_id
-        if not created_service_id:
-            created_service_id =  2
+        if not Service.query.filter(Service.id==created_service_id).one_or_none():
+            created_service_id = insert_mock_service().id
         res = self.client().delete(f'/services/{created_service_id}', headers=headers)
 
         if not TESTING_ACCESS_TOKEN:
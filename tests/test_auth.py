@@ -0,0 +1,138 @@
+from auth.auth import AuthError, JWKSKeyStore, cache_payload, get_cached_payload, token_cache, verify_decode_jwt
+from tests.fixtures import get_local_jwks
+from utils.cache import TTLCache
+import threading
+import time
+import unittest
+
+mock_jwks = {
+    'keys': [
+        { 'kty': 'RSA', 'kid': 'key-1', 'use': 'sig', 'n': 'abc', 'e': 'AQAB', 'alg': 'RS256' },
+        { 'kty': 'RSA', 'kid': 'key-2', 'use': 'sig', 'n': 'def', 'e': 'AQAB', 'alg': 'RS256' },
+    ]
+}
+
+class CountingFetcher:
+    def __init__(self, jwks=mock_jwks, delay=0, fail=False):
+        self.jwks = jwks
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, url):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError('JWKS endpoint unreachable')
+        return self.jwks
+
+class JWKSKeyStoreTesting(unittest.TestCase):
+    def test_keys_are_fetched_once(self):
+        """[auth] JWKS is fetched once and indexed by kid"""
+        fetcher = CountingFetcher()
+        store = JWKSKeyStore('https://test/.well-known/jwks.json', fetcher=fetcher)
+
+        self.assertEqual(store.get_key('key-1')['n'], 'abc')
+        self.assertEqual(store.get_key('key-2')['n'], 'def')
+        self.assertEqual(store.get_key('key-1')['n'], 'abc')
+        self.assertEqual(fetcher.calls, 1)
+        self.assertEqual(store.stats()['hits'], 2)
+        self.assertEqual(store.stats()['misses'], 1)
+        self.assertEqual(store.stats()['refreshes'], 1)
+        self.assertNotIn('alg', store.get_key('key-1'))
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        """[auth] unknown kid refreshes the keys at most once per interval"""
+        fetcher = CountingFetcher()
+        store = JWKSKeyStore('https://test/.well-known/jwks.json', min_refresh_interval=60, fetcher=fetcher)
+
+        self.assertIsNone(store.get_key('unknown'))
+        self.assertIsNone(store.get_key('unknown'))
+        self.assertEqual(fetcher.calls, 1)
+
+        store.min_refresh_interval = 0
+        self.assertIsNone(store.get_key('unknown'))
+        self.assertEqual(fetcher.calls, 2)
+
+    def test_concurrent_refreshes_are_collapsed(self):
+        """[auth] concurrent cold requests share a single JWKS fetch"""
+        fetcher = CountingFetcher(delay=0.1)
+        store = JWKSKeyStore('https://test/.well-known/jwks.json', fetcher=fetcher)
+        threads = [threading.Thread(target=store.get_key, args=('key-1',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetcher.calls, 1)
+        self.assertIsNotNone(store.get_key('key-1'))
+
+    def test_stale_keys_are_served_while_refreshing(self):
+        """[auth] stale keys are served while a failing refresh runs in the background"""
+        fetcher = CountingFetcher()
+        store = JWKSKeyStore('https://test/.well-known/jwks.json', ttl=0, min_refresh_interval=0, fetcher=fetcher)
+        store.get_key('key-1')
+        fetcher.fail = True
+
+        self.assertEqual(store.get_key('key-1')['n'], 'abc')
+        for _ in range(50):
+            if store.stats()['refresh_errors']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(store.stats()['refresh_errors'], 1)
+        self.assertEqual(store.get_key('key-2')['n'], 'def')
+
+class VerifiedTokenCacheTesting(unittest.TestCase):
+    def setUp(self):
+        token_cache.clear()
+
+    def test_payload_is_cached_until_token_expires(self):
+        """[auth] verified payloads are reused until the token expires"""
+        payload = { 'sub': 'auth0|1', 'permissions': [], 'exp': time.time() + 60 }
+        cache_payload('token-1', payload)
+        self.assertIs(get_cached_payload('token-1'), payload)
+        self.assertIsNone(get_cached_payload('token-2'))
+
+        cache_payload('token-3', { 'sub': 'auth0|3', 'exp': time.time() - 1 })
+        self.assertIsNone(get_cached_payload('token-3'))
+        self.assertEqual(token_cache.stats()['expirations'], 1)
+
+    def test_payload_without_expiration_is_not_cached(self):
+        """[auth] payloads without exp are never cached"""
+        cache_payload('token-1', { 'sub': 'auth0|1' })
+        self.assertIsNone(get_cached_payload('token-1'))
+
+    def test_cache_size_is_bounded(self):
+        """[auth] least recently used tokens are evicted over the size cap"""
+        cache = TTLCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+class VerifyDecodeJWTTesting(unittest.TestCase):
+    def setUp(self):
+        self.jwks = get_local_jwks()
+        token_cache.clear()
+
+    def test_local_token_is_verified(self):
+        """[auth] tokens minted locally are verified with the local JWKS"""
+        payload = verify_decode_jwt(self.jwks.token(['read:volunteers']))
+        self.assertEqual(payload['permissions'], ['read:volunteers'])
+
+    def test_expired_token_is_rejected(self):
+        """[auth] expired tokens are rejected"""
+        with self.assertRaises(AuthError) as error:
+            verify_decode_jwt(self.jwks.token(expires_in=-60))
+        self.assertEqual(error.exception.error['code'], 'token_expired')
+
+    def test_token_for_another_audience_is_rejected(self):
+        """[auth] tokens for another audience are rejected"""
+        with self.assertRaises(AuthError) as error:
+            verify_decode_jwt(self.jwks.token(aud='https://another.audience'))
+        self.assertEqual(error.exception.error['code'], 'invalid_claims')
@@ -0,0 +1,47 @@
+from utils.conflicts import find_conflicts, find_overlaps
+from datetime import datetime, timedelta
+import unittest
+
+def at(hour, minutes=0):
+    return datetime(2022, 4, 2, hour, minutes)
+
+class FindOverlapsTesting(unittest.TestCase):
+    def test_overlapping_intervals(self):
+        """[conflicts] intervals sharing any time overlap, including nested ones"""
+        intervals = [
+            (at(9), at(12), 1),
+            (at(10), at(11), 2),
+            (at(11, 30), at(13), 3),
+            (at(14), at(15), 4)
+        ]
+        overlaps = { frozenset(pair) for pair in find_overlaps(intervals) }
+        self.assertEqual(overlaps, { frozenset((1, 2)), frozenset((1, 3)) })
+
+    def test_consecutive_intervals_do_not_overlap(self):
+        """[conflicts] an interval ending when another starts does not overlap with it"""
+        intervals = [(at(9), at(10), 1), (at(10), at(11), 2)]
+        self.assertEqual(find_overlaps(intervals), [])
+
+    def test_same_start_intervals(self):
+        """[conflicts] intervals starting at the same time overlap"""
+        intervals = [(at(9), at(9, 30), 2), (at(9), at(12), 1), (at(9), at(10), 3)]
+        self.assertEqual(len(find_overlaps(intervals)), 3)
+
+class FindConflictsTesting(unittest.TestCase):
+    def test_conflicts_are_found_per_resource(self):
+        """[conflicts] only services sharing a resource conflict"""
+        assignments = [
+            (('volunteers', 1), 10, at(9), at(12)),
+            (('volunteers', 1), 11, at(11), at(13)),
+            (('volunteers', 2), 12, at(9), at(12)),
+            (('vehicles', 1), 11, at(11), at(13)),
+            (('vehicles', 1), 13, at(13), at(14))
+        ]
+        self.assertEqual(find_conflicts(assignments), { ('volunteers', 1): [(10, 11)] })
+
+    def test_many_services(self):
+        """[conflicts] every pair of overlapping services of a resource is reported once"""
+        assignments = [(('vehicles', 1), id, at(8) + timedelta(minutes=id), at(8) + timedelta(minutes=id + 5)) for id in range(100)]
+        conflicts = find_conflicts(assignments)[('vehicles', 1)]
+        self.assertEqual(len(conflicts), sum(min(4, 99 - id) for id in range(100)))
+        self.assertEqual(len(set(conflicts)), len(conflicts))
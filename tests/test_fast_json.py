@@ -0,0 +1,32 @@
+from datetime import date, datetime
+from flask import json
+from flask.json import JSONEncoder
+from config.setup import FAST_JSON
+from tests.fixtures import get_test_app
+from utils.fast_json import FastJSONEncoder
+import unittest
+
+def encode(encoder, document, **kwargs):
+    return json.dumps(document, cls=encoder, separators=(',', ':'), sort_keys=True, **kwargs)
+
+class FastJSONEncoderTesting(unittest.TestCase):
+    def test_same_output_as_the_standard_library(self):
+        """[json] documents are encoded byte by byte as by the standard library, dates included"""
+        document = {
+            'volunteers': [{ 'name': 'José', 'surnames': 'Peña 😀', 'birthday': date(1985, 3, 9), 'phone2': None, 'active': True }],
+            'date': datetime(2021, 12, 31, 19, 5, 3, 250),
+            'notes': 'line\nbreak\x7f "quoted" \\',
+            'count': 2 ** 40
+        }
+        for ensure_ascii in (True, False):
+            self.assertEqual(encode(FastJSONEncoder, document, ensure_ascii=ensure_ascii), encode(JSONEncoder, document, ensure_ascii=ensure_ascii))
+
+    def test_falls_back_to_the_standard_library(self):
+        """[json] what orjson can't encode the same way is encoded by the standard library"""
+        for document in ({ 10: 'a', 9: 'b' }, [2 ** 70]):
+            self.assertEqual(encode(FastJSONEncoder, document), encode(JSONEncoder, document))
+        self.assertEqual(json.dumps({ 'a': [1] }, cls=FastJSONEncoder, indent=2), json.dumps({ 'a': [1] }, cls=JSONEncoder, indent=2))
+
+    def test_app_encoder(self):
+        """[json] the app encodes its responses with orjson, unless FAST_JSON is false"""
+        self.assertIs(get_test_app().json_encoder, FastJSONEncoder if FAST_JSON else JSONEncoder)
@@ -0,0 +1,29 @@
+from utils.metrics import Histogram, RequestMetrics, labels
+import unittest
+
+class HistogramTesting(unittest.TestCase):
+    def test_cumulative_counts(self):
+        """[metrics] each bucket counts the values up to its bound, included"""
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 7, 50):
+            histogram.observe(value)
+
+        self.assertEqual(list(histogram.cumulative_counts()), [(1, 2), (5, 3), (10, 4), ('+Inf', 5)])
+        self.assertEqual(histogram.sum, 61.5)
+        self.assertEqual(histogram.count, 5)
+
+class RequestMetricsTesting(unittest.TestCase):
+    def test_render_by_endpoint(self):
+        """[metrics] requests are rendered by method and endpoint in Prometheus text format"""
+        metrics = RequestMetrics()
+        metrics.record('GET', '/volunteers/<int:id>', 200, 0.02, 512, 3, 0.004)
+        metrics.record('GET', '/volunteers/<int:id>', 404, 0.01, 128, 1, 0.001)
+        text = metrics.render()
+
+        self.assertIn('http_request_duration_seconds_count{method="GET",endpoint="/volunteers/<int:id>"} 2', text)
+        self.assertIn('http_request_db_queries_sum{method="GET",endpoint="/volunteers/<int:id>"} 4', text)
+        self.assertIn('http_responses_total{method="GET",endpoint="/volunteers/<int:id>",status="404"} 1', text)
+
+    def test_labels_are_escaped(self):
+        """[metrics] quotes and backslashes of the label values are escaped"""
+        self.assertEqual(labels(endpoint='a"b\\c'), '{endpoint="a\\"b\\\\c"}')
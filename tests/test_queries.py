@@ -0,0 +1,48 @@
+from flask import Flask
+from sqlalchemy import create_engine
+from utils.queries import init_query_detector, normalize_sql, query_budget
+import unittest
+
+class NormalizeSQLTesting(unittest.TestCase):
+    def test_literals_and_parameters(self):
+        """[queries] literals and parameters of any dialect normalize the same"""
+        self.assertEqual(normalize_sql("SELECT * FROM volunteers WHERE id = 42 AND name = 'O''Neil'"), 'SELECT * FROM volunteers WHERE id = ? AND name = ?')
+        self.assertEqual(normalize_sql('SELECT * FROM volunteers\n  WHERE id = %(id_1)s'), 'SELECT * FROM volunteers WHERE id = ?')
+        self.assertEqual(normalize_sql('SELECT * FROM volunteers WHERE id = ?'), 'SELECT * FROM volunteers WHERE id = ?')
+
+    def test_lists(self):
+        """[queries] lists of values of any length normalize the same"""
+        self.assertEqual(normalize_sql('SELECT * FROM groups WHERE id IN (?, ?, ?)'), normalize_sql('SELECT * FROM groups WHERE id IN (7)'))
+
+class QueryDetectorTesting(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.detector = init_query_detector(self.app, repeat_threshold=2, slow_query_ms=1000)
+        engine = create_engine('sqlite://')
+
+        @self.app.route('/budgeted')
+        @query_budget(2)
+        def budgeted():
+            for id in range(3):
+                engine.execute('SELECT ?', id)
+            return 'ok'
+
+        @self.app.route('/unbudgeted')
+        def unbudgeted():
+            for id in range(3):
+                engine.execute('SELECT ?', id)
+            return 'ok'
+
+    def test_budget_exceeded(self):
+        """[queries] requests over the query budget of their route are kept as violations"""
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            self.app.test_client().get('/budgeted')
+        self.assertEqual(self.detector.violations, ['GET /budgeted issued 3 SQL statements, over its budget of 2'])
+
+    def test_repeated_statements(self):
+        """[queries] statements repeated over the threshold are logged with their origin"""
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.app.test_client().get('/unbudgeted')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Possible N+1 query on GET /unbudgeted: 3 times from tests/test_queries.py', logs.output[0])
+        self.assertEqual(self.detector.violations, [])
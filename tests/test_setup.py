@@ -0,0 +1,80 @@
+from config.setup import CountingQueuePool, PooledSQLAlchemy, engine_options, DATABASE_URL_FOR_TESTING, DB_MAX_OVERFLOW, DB_POOL_SIZE
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError
+import gc
+import os
+import runpy
+import sqlite3
+import unittest
+
+def connect():
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+class EngineOptionsTesting(unittest.TestCase):
+    def test_sqlite_keeps_driver_defaults(self):
+        """[setup] SQLite databases keep the default pool"""
+        self.assertEqual(engine_options('sqlite:///local.db'), {})
+
+    def test_postgresql_pool_options(self):
+        """[setup] PostgreSQL pools are configured from the environment"""
+        options = engine_options('postgresql+psycopg2://postgres@localhost/postgres')
+        self.assertIs(options['poolclass'], CountingQueuePool)
+        self.assertEqual(options['pool_size'], DB_POOL_SIZE)
+        self.assertIn('pool_pre_ping', options)
+        self.assertIn('pool_recycle', options)
+
+class CountingQueuePoolTesting(unittest.TestCase):
+    def test_checkouts_and_timeouts_are_counted(self):
+        """[setup] the pool counts checkouts and the checkouts that timed out"""
+        pool = CountingQueuePool(connect, pool_size=1, max_overflow=0, timeout=0.01)
+        connection = pool.connect()
+        with self.assertRaises(TimeoutError):
+            pool.connect()
+        connection.close()
+        pool.connect().close()
+
+        self.assertEqual(pool.checkouts, 2)
+        self.assertEqual(pool.timeouts, 1)
+
+    def test_recreated_pool_keeps_its_class(self):
+        """[setup] pools reset on forked workers still count their checkouts"""
+        pool = CountingQueuePool(connect, pool_size=1, max_overflow=0)
+        pool.connect().close()
+        recreated = pool.recreate()
+
+        self.assertIsInstance(recreated, CountingQueuePool)
+        self.assertEqual(recreated.checkouts, 0)
+        self.assertEqual(recreated.checkedin(), 0)
+        self.assertEqual(recreated.max_overflow, 0)
+
+@unittest.skipUnless(DATABASE_URL_FOR_TESTING and DATABASE_URL_FOR_TESTING.startswith('postgresql'), 'Needs DATABASE_URL_FOR_TESTING on PostgreSQL')
+class ResetPoolsTesting(unittest.TestCase):
+    def test_forked_process_leaves_the_parent_connections_open(self):
+        """[setup] a forked process closing its inherited connections leaves them open for the parent"""
+        # Without pre-ping, a connection ended by the child would fail instead of being replaced
+        options = dict(engine_options(DATABASE_URL_FOR_TESTING), pool_pre_ping=False)
+        engine = PooledSQLAlchemy().create_engine(make_url(DATABASE_URL_FOR_TESTING), options)
+        with engine.connect() as connection:
+            backend = connection.execute('SELECT pg_backend_pid()').scalar()
+
+        pid = os.fork()
+        if pid == 0:
+            # The pools were reset when forking, the inherited connections are closed now at the latest
+            engine.dispose()
+            gc.collect()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute('SELECT pg_backend_pid()').scalar(), backend)
+        engine.dispose()
+
+class GunicornConfigTesting(unittest.TestCase):
+    def test_threads_fit_in_the_pool(self):
+        """[setup] the threads of each worker never wait for a database connection"""
+        config = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py'))
+
+        self.assertLessEqual(config['threads'], DB_POOL_SIZE + DB_MAX_OVERFLOW)
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertTrue(config['preload_app'])
+        self.assertGreater(config['max_requests_jitter'], 0)
@@ -1,5 +1,4 @@
 from flask import jsonify, request
-import requests
 from dotenv import load_dotenv, find_dotenv
 from os import environ as env
 
@@ -7,6 +6,9 @@ AUTH0_USER_API_BEARER_TOKEN = env.get('AUTH0_USER_API_BEARER_TOKEN')
 AUTH0_DOMAIN  = env.get('AUTH0_DOMAIN')
 
 def get_user_info(user_id):
+    # Only needed here, and slow to import on every worker start
+    import requests
+
     url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}'
     headers = {
       'Content-Type': "application/json",
@@ -0,0 +1,35 @@
+from collections import defaultdict
+import heapq
+
+def find_overlaps(intervals):
+    """Pairs of keys of the `intervals` that overlap, with a sweep over their starts.
+
+    Each interval is a (start, end, key) tuple, the end being excluded. Runs in
+    O((n + k) log n) for n intervals and k overlapping pairs.
+    """
+    overlaps = []
+    ongoing = []
+    for position, (start, end, key) in enumerate(sorted(intervals, key=lambda interval: interval[:2])):
+        while ongoing and ongoing[0][0] <= start:
+            heapq.heappop(ongoing)
+        overlaps.extend((other_key, key) for _, _, other_key in ongoing)
+        # The position breaks ties between equal ends, so the keys are never compared
+        heapq.heappush(ongoing, (end, position, key))
+    return overlaps
+
+def find_conflicts(assignments):
+    """Services overlapping in time that share a resource.
+
+    Takes (resource, service_id, start, end) tuples and returns a dict with the pairs of
+    conflicting service ids of each resource that has any.
+    """
+    intervals = defaultdict(list)
+    for resource, service_id, start, end in assignments:
+        intervals[resource].append((start, end, service_id))
+
+    conflicts = {}
+    for resource, resource_intervals in intervals.items():
+        overlaps = find_overlaps(resource_intervals)
+        if overlaps:
+            conflicts[resource] = overlaps
+    return conflicts
@@ -0,0 +1,78 @@
+from datetime import date, datetime
+from flask.json import JSONEncoder
+from functools import lru_cache
+from werkzeug.http import http_date
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+# Characters escaped by the standard library with `ensure_ascii`, besides the control characters orjson already escapes
+NOT_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+@lru_cache(maxsize=65536)
+def day_prefix(day):
+    return f'{WEEKDAYS[day.weekday()]}, {day.day:02d} {MONTHS[day.month - 1]} {day.year:04d} '
+
+def format_date(value):
+    """`value` as Flask serializes the dates and datetimes (an HTTP date), without going through `email.utils`."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return http_date(value)
+        return day_prefix(value.date()) + '%02d:%02d:%02d GMT' % (value.hour, value.minute, value.second)
+    return day_prefix(value) + '00:00:00 GMT'
+
+def escape_not_ascii(text):
+    """`text` with the characters out of ASCII escaped as by the standard library with `ensure_ascii`."""
+    # backslashreplace writes \xNN for the first 256 code points, the same as \u00NN in JSON, unless a
+    # literal backslash comes before it. Those, and the \UNNNNNNNN written past U+FFFF, go through the regular expression
+    escaped = text.encode('ascii', 'backslashreplace')
+    if b'\\U' in escaped or b'\\\\x' in escaped:
+        return NOT_ASCII.sub(escape_character, text)
+    return escaped.replace(b'\\x', b'\\u00').replace(b'\x7f', b'\\u007f').decode()
+
+def escape_character(match):
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+
+class FastJSONEncoder(JSONEncoder):
+    """Flask's JSONEncoder, encoding with orjson the documents `jsonify` and `json.dumps` write compactly.
+
+    The output is the same as the standard library's, byte by byte: the keys are sorted the
+    same way, the dates are written as HTTP dates and, with `ensure_ascii`, the characters out
+    of ASCII are escaped. Floats are the exception, as orjson writes their exponents without
+    sign nor leading zeros (`1e16`, not `1e+16`), but no resource has them. Pretty printed
+    documents, dictionaries with keys other than strings and the values orjson can't encode
+    are left to the standard library.
+    """
+    def encode(self, o):
+        if self.indent is not None or self.item_separator != ',' or self.key_separator != ':' or self.skipkeys:
+            return super().encode(o)
+
+        try:
+            encoded = orjson.dumps(o, default=self.encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME | (orjson.OPT_SORT_KEYS if self.sort_keys else 0))
+        except TypeError:
+            return super().encode(o)
+
+        text = encoded.decode()
+        if self.ensure_ascii and (not encoded.isascii() or b'\x7f' in encoded):
+            text = escape_not_ascii(text)
+        return text
+
+    def encode_default(self, o):
+        if isinstance(o, date):
+            return format_date(o)
+        return self.default(o)
+
+def init_json(app, fast=True):
+    """Makes `app` encode its JSON with orjson when `fast` and orjson is installed, with the standard library otherwise."""
+    if fast and orjson is not None:
+        app.json_encoder = FastJSONEncoder
+    return app.json_encoder
@@ -0,0 +1,36 @@
+from sqlalchemy.orm import load_only
+
+class Field:
+    """Key of a serialized resource, with the columns and relationships its value is read from.
+
+    The value is the attribute of the same name, unless a `value` function of the row is given.
+    """
+    def __init__(self, columns=(), relations=(), value=None):
+        self.columns = tuple(columns)
+        self.relations = tuple(relations)
+        self.value = value
+
+    def get(self, row, name):
+        return self.value(row) if self.value is not None else getattr(row, name)
+
+def parse_fields(requested, allowed):
+    """The fields of a comma separated `fields` parameter, without repetitions, and the ones not in `allowed`.
+
+    Returns None as the fields when none was requested.
+    """
+    if not requested or not requested.strip(','):
+        return None, []
+    names = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    return names, [name for name in names if name not in allowed]
+
+def field_options(fields, names, keys=()):
+    """Loader options reading only the columns and relationships of the fields `names`, and the columns of `keys`.
+
+    The columns of the pagination keys are always needed, to write the cursor of the next page.
+    """
+    columns = { column for name in names for column in fields[name].columns }
+    columns.update(key.key for key in keys)
+    return [load_only(*sorted(columns))] + [relation for name in names for relation in fields[name].relations]
+
+def serialize_fields(row, fields, names):
+    return { name: fields[name].get(row, name) for name in names }
@@ -0,0 +1,133 @@
+from bisect import bisect_left
+from collections import defaultdict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Counts of the observed values by upper bound, as Prometheus histograms do."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        # Not cumulative here, the counts of each bucket are added up when rendered
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+class RequestMetrics:
+    """Latency, response size, status, SQL queries and SQL time of the requests, by endpoint.
+
+    The endpoints are the URL rules of the app, so the labels are bounded whatever the
+    requested URLs. Requests not matching any rule are counted under `unmatched`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.size = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERIES_BUCKETS))
+        self.db_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.statuses = defaultdict(int)
+
+    def record(self, method, endpoint, status, duration, size, queries, db_time):
+        key = (method, endpoint)
+        with self._lock:
+            self.latency[key].observe(duration)
+            if size is not None:
+                self.size[key].observe(size)
+            self.queries[key].observe(queries)
+            self.db_time[key].observe(db_time)
+            self.statuses[(method, endpoint, status)] += 1
+
+    def render(self):
+        with self._lock:
+            return '\n'.join([
+                *render_histogram('http_request_duration_seconds', 'Time to handle the requests, until the response starts.', self.latency),
+                *render_histogram('http_response_size_bytes', 'Size of the responses, except the streamed ones.', self.size),
+                *render_histogram('http_request_db_queries', 'SQL statements executed per request.', self.queries),
+                *render_histogram('http_request_db_duration_seconds', 'Time spent executing SQL statements per request.', self.db_time),
+                '# HELP http_responses_total Responses sent, by status code.',
+                '# TYPE http_responses_total counter',
+                *(f'http_responses_total{labels(method=method, endpoint=endpoint, status=status)} {count}'
+                    for (method, endpoint, status), count in sorted(self.statuses.items()))
+            ])
+
+def labels(**values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(values, escaped)) + '}'
+
+def render_histogram(name, description, histograms):
+    yield f'# HELP {name} {description}'
+    yield f'# TYPE {name} histogram'
+    for (method, endpoint), histogram in sorted(histograms.items()):
+        for bound, count in histogram.cumulative_counts():
+            yield f'{name}_bucket{labels(method=method, endpoint=endpoint, le=bound)} {count}'
+        yield f'{name}_sum{labels(method=method, endpoint=endpoint)} {histogram.sum:.6f}'
+        yield f'{name}_count{labels(method=method, endpoint=endpoint)} {histogram.count}'
+
+def render_gauges(name, description, samples, kind='gauge'):
+    """Lines of a metric with a value for each (labels dict, value) sample, skipping the unknown values."""
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{labels(**sample_labels) if sample_labels else ""} {value}' for sample_labels, value in samples if value is not None)
+    return '\n'.join(lines)
+
+# region SQL statements of the current request
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def count_request_query(connection, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'metrics_started' not in g:
+        return
+    started = getattr(context, '_metrics_started', None)
+    g.metrics_queries += 1
+    if started is not None:
+        g.metrics_db_time += time.perf_counter() - started
+# endregion
+
+def init_metrics(app, server_timing=True):
+    """Records the metrics of every request of `app` on `app.extensions['request_metrics']`.
+
+    With `server_timing`, the responses also tell their own timings in a Server-Timing header.
+    """
+    metrics = RequestMetrics()
+    app.extensions['request_metrics'] = metrics
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_time = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' not in g:
+            return response
+        duration = time.perf_counter() - g.metrics_started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics.record(request.method, endpoint, response.status_code, duration, size, g.metrics_queries, g.metrics_db_time)
+
+        if server_timing:
+            response.headers.add('Server-Timing', f'app;dur={duration * 1000:.1f}')
+            response.headers.add('Server-Timing', f'db;dur={g.metrics_db_time * 1000:.1f};desc="{g.metrics_queries} queries"')
+        return response
+
+    return metrics
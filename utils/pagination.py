@@ -0,0 +1,96 @@
+from sqlalchemy import DateTime, and_, or_
+from datetime import datetime
+import base64
+import binascii
+import json
+
+MIN_BIGINT = -2 ** 63
+MAX_BIGINT = 2 ** 63 - 1
+
+def get_page_limit(limit, default, maximum):
+    if limit is None:
+        return default
+    limit = int(limit)
+    if limit < 1:
+        raise ValueError('The page limit must be a positive number')
+    return min(limit, maximum)
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def load_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError):
+        raise ValueError('The cursor provided is not valid')
+    if type(values) != list or len(values) != length:
+        raise ValueError('The cursor provided is not valid')
+    return values
+
+def is_bigint(value):
+    # Integers a BIGINT bound parameter can hold, booleans and floats aside
+    return type(value) == int and MIN_BIGINT <= value <= MAX_BIGINT
+
+def decode_cursor(cursor, keys):
+    values = load_cursor(cursor, len(keys))
+
+    try:
+        decoded = [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) else value
+            for key, value in zip(keys, values)
+        ]
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('The cursor provided is not valid')
+    if not all(isinstance(key.type, DateTime) or is_bigint(value) for key, value in zip(keys, decoded)):
+        raise ValueError('The cursor provided is not valid')
+    return decoded
+
+def after_keys(keys, values):
+    # (k1, k2) > (v1, v2) spelled out, as row value comparisons are not portable
+    key, value = keys[0], values[0]
+    if len(keys) == 1:
+        return key > value
+    return or_(key > value, and_(key == value, after_keys(keys[1:], values[1:])))
+
+def paginate(query, keys, limit, cursor=None):
+    """Keyset pagination of `query` ordered by `keys`.
+
+    Returns the rows of the page and the cursor of the next one (None on the last page).
+    """
+    if cursor:
+        query = query.filter(after_keys(keys, decode_cursor(cursor, keys)))
+
+    rows = query.order_by(*keys).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows, next_cursor
+
+def paginate_by_offset(query, limit, cursor=None):
+    """Offset pagination of an already ordered `query`, for orders without a unique key such as search ranks.
+
+    Returns the rows of the page and the cursor of the next one (None on the last page).
+    """
+    offset = 0
+    if cursor:
+        offset, = load_cursor(cursor, 1)
+        if not is_bigint(offset) or offset < 0:
+            raise ValueError('The cursor provided is not valid')
+
+    rows = query.offset(offset).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([offset + limit])
+    return rows, next_cursor
+
+def iterate_pages(query, keys, chunk_size):
+    """Yields every row of `query`, one keyset page of `chunk_size` rows at a time."""
+    cursor = None
+    while True:
+        rows, cursor = paginate(query, keys, chunk_size, cursor)
+        yield rows
+        if cursor is None:
+            return
@@ -0,0 +1,124 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import re
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|\b\d+(?:\.\d+)?\b|\?")
+PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+SPACES = re.compile(r'\s+')
+# Transaction control, not counted as queries: the tests run every request inside SAVEPOINTs
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+def normalize_sql(statement):
+    """`statement` with its literals, parameters and lists of them replaced by `?`.
+
+    The statements issued by the same line of code, whatever their values, normalize the same.
+    """
+    statement = LITERALS.sub('?', statement)
+    statement = PLACEHOLDER_LISTS.sub('(?)', statement)
+    return SPACES.sub(' ', statement).strip()
+
+def query_budget(limit):
+    """Most SQL statements the requests of the decorated route may issue, checked by the query detector."""
+    def query_budget_decorator(f):
+        f.query_budget = limit
+        return f
+    return query_budget_decorator
+
+def statement_origin():
+    # Innermost frame of the application code, outside of this module and the installed packages
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(ROOT) and filename != __file__ and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+class QueryDetector:
+    """Finds the N+1 queries, slow statements and exceeded query budgets of the requests.
+
+    The statements of each request are grouped by their normalized SQL: the ones repeated more
+    than `repeat_threshold` times and the ones taking more than `slow_query_ms` are logged as
+    warnings, with the line of the application that issued them. The requests issuing more
+    statements than the `query_budget` of their route are logged as errors and kept on
+    `violations`, so the tests can fail on them.
+    """
+    def __init__(self, logger, repeat_threshold=5, slow_query_ms=100):
+        self.logger = logger
+        self.repeat_threshold = repeat_threshold
+        self.slow_query_ms = slow_query_ms
+        self.violations = []
+        self._lock = threading.Lock()
+
+    def statement_executed(self, statement, duration):
+        normalized = normalize_sql(statement)
+        statements = g.query_detector_statements
+        if normalized not in statements:
+            statements[normalized] = [0, statement_origin()]
+        statements[normalized][0] += 1
+        g.query_detector_count += 1
+
+        if duration * 1000 > self.slow_query_ms:
+            self.logger.warning('Slow SQL statement on %s %s: %.1f ms, from %s: %s',
+                request.method, request.path, duration * 1000, statement_origin(), normalized)
+
+    def check_request(self, view):
+        endpoint = f'{request.method} {request.url_rule.rule if request.url_rule is not None else request.path}'
+        for normalized, (count, origin) in g.query_detector_statements.items():
+            if count > self.repeat_threshold:
+                self.logger.warning('Possible N+1 query on %s: %d times from %s: %s', endpoint, count, origin, normalized)
+
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and g.query_detector_count > budget:
+            violation = f'{endpoint} issued {g.query_detector_count} SQL statements, over its budget of {budget}'
+            self.logger.error(violation)
+            with self._lock:
+                self.violations.append(violation)
+
+# region SQL statements of the current request
+listening = threading.Lock()
+
+def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_detector_started = time.perf_counter()
+
+def detect_statement(connection, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'query_detector' not in g or statement.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+        return
+    started = getattr(context, '_query_detector_started', None)
+    g.query_detector.statement_executed(statement, time.perf_counter() - started if started is not None else 0)
+# endregion
+
+def init_query_detector(app, repeat_threshold=5, slow_query_ms=100):
+    """Watches the SQL statements of every request of `app` with a QueryDetector, on `app.extensions['query_detector']`.
+
+    Meant for development and CI: finding the origin of every statement makes them slower.
+    """
+    detector = QueryDetector(app.logger, repeat_threshold, slow_query_ms)
+    app.extensions['query_detector'] = detector
+
+    with listening:
+        if not event.contains(Engine, 'after_cursor_execute', detect_statement):
+            event.listen(Engine, 'before_cursor_execute', start_statement_timer)
+            event.listen(Engine, 'after_cursor_execute', detect_statement)
+
+    @app.before_request
+    def start_query_detector():
+        g.query_detector = detector
+        g.query_detector_statements = {}
+        g.query_detector_count = 0
+
+    @app.after_request
+    def check_query_detector(response):
+        if 'query_detector' in g:
+            detector.check_request(app.view_functions.get(request.endpoint))
+        return response
+
+    return detector